@@ -1,15 +1,32 @@
 import streamlit as st
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, CSVLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
-from fpdf import FPDF
-import time
+from legal_analyzer import config, prompts
+from legal_analyzer.answers import answer_context_key, get_answer_cache
+from legal_analyzer.cache import get_shared_cache
+from legal_analyzer.chunking import chunk_stats, chunk_token_budget
+from legal_analyzer.docstore import document_key, get_document_store
+from legal_analyzer.ingest import get_format, iter_document_chunks, iter_pages
+from legal_analyzer.jobs import ACTIVE, get_job_manager
+from legal_analyzer.pipeline import chunks_key
+from legal_analyzer.reports import report_pdf
+from legal_analyzer.retrieval import build_context, get_index
+from legal_analyzer.revisions import RevisionStore, count_changes
+from legal_analyzer.risks import (
+    collect_risks, format_risk_delta, merge_risks, risk_delta, screened_chunks,
+)
+from legal_analyzer.runner import get_shared_runner, track_first_token
+from legal_analyzer.tracing import span, trace
 
 load_dotenv()
 
+# Titles of the sections of the PDF reports
+SUMMARY_TITLE = "Legal Document Summary"
+RISK_TITLE = "Risk Assessment Report"
+
+# URL query parameters that remember the running "summary" and "risk
+# assessment" jobs across page reloads
+JOB_QUERY_PARAMS = {"summary": "summary_job", "risk assessment": "risk_job"}
+
 # Initialize session state variables
 if "default_model" not in st.session_state:
     st.session_state["default_model"] = "llama-3.3-70b-versatile"
@@ -19,8 +36,162 @@ if "final_summary" not in st.session_state:
     st.session_state["final_summary"] = ""
 if "risk_assessment" not in st.session_state:
     st.session_state["risk_assessment"] = ""
-if "chunks" not in st.session_state:
-    st.session_state["chunks"] = []
+if "document" not in st.session_state:
+    st.session_state["document"] = None
+if "revisions" not in st.session_state:
+    st.session_state["revisions"] = RevisionStore()
+if "first_token_seconds" not in st.session_state:
+    st.session_state["first_token_seconds"] = {}
+if "traces" not in st.session_state:
+    st.session_state["traces"] = {}
+if "jobs" not in st.session_state:
+    # A reloaded page picks up the jobs it started from the URL
+    st.session_state["jobs"] = {
+        name: st.query_params[param] for name, param in JOB_QUERY_PARAMS.items() if param in st.query_params
+    }
+if "job_errors" not in st.session_state:
+    st.session_state["job_errors"] = {}
+
+single_pass = st.sidebar.checkbox(
+    "Single-pass analysis",
+    help="Summarize each chunk and assess its risks in one LLM call. "
+    "Summarize and Generate Risk Assessment then reuse each other's chunk results.",
+)
+pack_chunks = st.sidebar.checkbox(
+    "Pack small chunks",
+    value=config.PACK_CHUNKS,
+    help="Send several small chunks in one LLM call instead of one call per chunk, "
+    "saving requests and repeated prompt instructions.",
+)
+compare_versions = st.sidebar.checkbox(
+    "Compare with the previous upload",
+    help="Treat an upload as a revision of the previous document. Only new and edited chunks are "
+    "analyzed again and the risk assessment lists what changed.",
+)
+show_performance_panel = st.sidebar.checkbox(
+    "Show performance panel",
+    help="Time, tokens, retries and queue wait of every stage of the last analysis run.",
+)
+
+
+job_manager = get_job_manager()
+document_store = get_document_store()
+answer_cache = get_answer_cache()
+
+
+def start_job(name):
+    # Submit the "summary" or "risk assessment" of the uploaded document to the
+    # job manager. Chunk results the session already has are passed along, so
+    # the job only analyzes the missing chunks.
+    store = st.session_state["revisions"]
+    params = {
+        "texts": list(store.current.texts),
+        "single_pass": single_pass,
+        "pack_chunks": pack_chunks,
+        "chunk_results": {kind: store.known_results(kind) for kind in ("summaries", "risks")},
+    }
+    if name == "summary":
+        params["memo"] = dict(store.reduce_memo())
+    job_id = job_manager.submit(name, params)
+    st.session_state["jobs"][name] = job_id
+    st.session_state["job_errors"].pop(name, None)
+    st.query_params[JOB_QUERY_PARAMS[name]] = job_id
+
+
+def finish_job(name, job):
+    # Take over the results of a finished job into the session
+    del st.session_state["jobs"][name]
+    if JOB_QUERY_PARAMS[name] in st.query_params:
+        del st.query_params[JOB_QUERY_PARAMS[name]]
+    if job is None:
+        st.session_state["job_errors"][name] = "The analysis job was not found, please start it again."
+        return
+    if job["status"] != "done":
+        st.session_state["job_errors"][name] = job["error"]
+        return
+
+    result = job["result"]
+    run = job_manager.trace(job["id"])
+    if run is not None:
+        st.session_state["traces"][name] = run
+
+    # The chunk results are only kept if the job analyzed the current document
+    store = st.session_state["revisions"]
+    current = store.current is not None and chunks_key(store.current.texts) == result["chunks_key"]
+    if current:
+        for kind, pairs in result["chunk_results"].items():
+            store.put(kind, [i for i, _ in pairs], [value for _, value in pairs])
+        store.current.reduced.update(result.get("memo", {}))
+
+    if name == "summary":
+        st.session_state["final_summary"] = result["text"]
+        return
+
+    report = result["text"]
+    st.session_state["risk_screened"] = None
+    if current:
+        chunk_risks = store.results("risks")
+        st.session_state["risk_screened"] = (len(screened_chunks(chunk_risks)), len(chunk_risks))
+
+        # When comparing versions, the report starts with what changed
+        previous_risks = store.previous_risks()
+        if previous_risks is not None:
+            records, _ = collect_risks(chunk_risks)
+            report = format_risk_delta(*risk_delta(previous_risks, merge_risks(records))) + "\n\n" + report
+    st.session_state["risk_assessment"] = report
+
+
+@st.fragment(run_every=1.0)
+def follow_job(name):
+    # Progress of the running job, polled every second. The final answer shows
+    # up while it is being written. Once the job has finished its results are
+    # taken over and the whole page is rerun.
+    job = job_manager.status(st.session_state["jobs"][name])
+    if job is not None and job["status"] in ACTIVE:
+        st.progress(job["done"] / job["total"] if job["total"] else 0.0)
+        st.caption(job["stage"] or "Waiting for a free worker...")
+        if job["partial"]:
+            st.markdown(job["partial"])
+        return
+    finish_job(name, job)
+    st.rerun()
+
+
+def stream_with_timing(pieces, stage):
+    # Write a streamed answer as it arrives, logging its time to first token.
+    # Returns the complete text.
+    def record(seconds):
+        print(f"Time to first token ({stage}): {seconds:.2f}s")
+        st.session_state["first_token_seconds"][stage] = seconds
+
+    text = st.write_stream(track_first_token(pieces, record))
+    if stage in st.session_state["first_token_seconds"]:
+        st.caption(f"First token after {st.session_state['first_token_seconds'][stage]:.1f}s")
+    return text
+
+
+def download_report(label, file_name, sections, name):
+    # Download button for a PDF report of (title, text) sections. The PDF is
+    # only rendered when the button is clicked, and once per content.
+    st.download_button(
+        label=label,
+        data=lambda: report_pdf(sections, name),
+        file_name=file_name,
+        mime="application/pdf",
+    )
+
+
+def show_performance(name):
+    # Stage breakdown of the last "upload", "summary", "risk assessment" or
+    # "qna" run, if the panel is switched on
+    run = st.session_state["traces"].get(name)
+    if not show_performance_panel or run is None:
+        return
+    with st.expander("Performance"):
+        st.caption(f"{run.root.seconds:.1f}s in total. Queue wait is time spent waiting for "
+                   f"rate limits and in-flight slots, llm.* rows add up concurrent calls.")
+        st.dataframe(run.summary(), hide_index=True)
+
 
 tab1, tab2, tab3 = st.tabs(["Summary", "QnA ChatBot","Risk Assessment"])
 
@@ -33,168 +204,122 @@ with tab1:
     # Upload File
     uploaded_file = st.file_uploader("Choose a file", type=["pdf", "txt", "csv"])
 
-    llm = ChatGroq(model="mixtral-8x7b-32768")
-    parser = StrOutputParser()
-    prompt_template = ChatPromptTemplate.from_template("Summarize the Following Document {document}")
-    chain = prompt_template | llm | parser
+    # Built once per process and shared by all sessions
+    runner = get_shared_runner()
 
-    if uploaded_file is not None:
-        with st.spinner("Processing..."):
+    # Streamlit reruns the script on every interaction, the file is only
+    # processed again when a different one is uploaded
+    if uploaded_file is not None and st.session_state.get("uploaded_file_id") != uploaded_file.file_id:
+        with st.spinner("Processing..."), trace("upload", file_type=uploaded_file.type) as run:
+            st.session_state["traces"]["upload"] = run
             try:
-                print("File: ", uploaded_file)
-                print("File type: ", uploaded_file.type)
-                
-                temp_file_path = uploaded_file.name
-                print("File path: ", temp_file_path)
-                
-                # Save uploaded file
-                with open(temp_file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-
-                # Create document loader
-                if uploaded_file.type == "text/plain":
-                    loader = TextLoader(temp_file_path)
-                elif uploaded_file.type == "text/csv":
-                    loader = CSVLoader(temp_file_path)
-                elif uploaded_file.type == "application/pdf":
-                    loader = PyPDFLoader(temp_file_path)
-                else:
+                if get_format(uploaded_file.name, uploaded_file.type) is None:
                     st.error("File type is not supported!")
                     st.stop()
-                    
-                # Create the document    
-                doc = loader.load()
-                print(doc)
-                
-                # Text Splitter - make chunks smaller to avoid token limits
-                text_splitter = CharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+
+                # The upload is read from memory, long PDFs page-parallel in a
+                # pool of processes, and split into chunks while later pages
+                # are still being read. A file another session already
+                # uploaded is not read again, the sessions share its chunks.
+                data = uploaded_file.getvalue()
+                key = document_key(data, uploaded_file.type, chunk_token_budget())
+                with span("ingest") as ingest_span:
+                    document = document_store.get(key)
+                    ingest_span.set("shared", document is not None)
+                    if document is None:
+                        progress = st.progress(0.0, text="Reading pages...")
+                        pages = []
+
+                        def on_page(page):
+                            pages.append(page)
+                            total = page.metadata.get("total_pages")
+                            if total:
+                                progress.progress(len(pages) / total, text=f"Read page {len(pages)} of {total}")
+
+                        chunks = list(iter_document_chunks(
+                            iter_pages(data, uploaded_file.name, uploaded_file.type), on_page=on_page
+                        ))
+                        document = document_store.put(key, chunks, chunk_stats(pages, chunks))
+                        ingest_span.set("pages", len(pages))
+                        del pages, chunks
+                        progress.empty()
+                    ingest_span.set("chunks", len(document))
+                st.session_state["document"] = document
+                st.session_state["chunk_stats"] = document.stats
+
+                # Line the chunks up with the previous upload to reuse its results
+                changes = st.session_state["revisions"].add_version(document, compare=compare_versions)
+                st.session_state["version_changes"] = count_changes(changes) if changes is not None else None
                 
-                # Split the document into chunks
-                st.session_state["chunks"] = text_splitter.split_documents(doc)
-                print(f"Number of chunks: {len(st.session_state['chunks'])}")
+                # Build the QnA search index now, so questions can be answered right away
+                with span("index"):
+                    get_index(document, key=document.key)
+                st.session_state["uploaded_file_id"] = uploaded_file.file_id
             
             except Exception as e:
                 print(e)
                 st.error(f"Error processing file: {e}")
+    if uploaded_file is not None:
         st.success("File Uploaded")
+        if "chunk_stats" in st.session_state:
+            stats = st.session_state["chunk_stats"]
+            st.caption(
+                f"{stats['chunks']} chunks, {stats['mean_tokens']} tokens on average "
+                f"(max {stats['max_tokens']}, about {stats['total_tokens']} in total). "
+                f"The fixed 800-character splitter would need about {stats['fixed_chunks']} chunks, "
+                f"{stats['calls_saved']} more LLM calls per analysis."
+            )
+        if st.session_state.get("version_changes"):
+            changes = st.session_state["version_changes"]
+            st.caption(
+                f"Compared with the previous upload: {changes['unchanged']} chunks unchanged, "
+                f"{changes['changed']} changed, {changes['added']} added and {changes['removed']} removed. "
+                f"Only changed and added chunks are analyzed again."
+            )
+        if show_performance_panel and st.session_state["document"] is not None:
+            # Chunk text held for this session's versions and for all sessions
+            revisions = st.session_state["revisions"]
+            session_documents = {
+                version.texts.key: version.texts
+                for version in (revisions.current, revisions.previous)
+                if version is not None
+            }
+            memory = document_store.stats()
+            st.caption(
+                f"Document memory: {sum(d.nbytes() for d in session_documents.values()) / 2**20:.1f} MB "
+                f"for this session, {memory['bytes'] / 2**20:.1f} MB for the {memory['documents']} documents "
+                f"of all sessions. {memory['hits']} uploads reused a document already in memory."
+            )
+        show_performance("upload")
 
     # Summary of Document
-    if st.button("Summarize"):
-        if "chunks" in st.session_state and st.session_state["chunks"]:
-            summary_container = st.empty()
-            chunk_summaries = []
-            
-            with st.spinner("Analyzing document chunks..."):
-                progress_bar = st.progress(0)
-                total_chunks = len(st.session_state["chunks"])
-                
-                try:
-                    for i, chunk in enumerate(st.session_state["chunks"]):
-                        # Summary prompt
-                        chunk_prompt = ChatPromptTemplate.from_template(
-                            "You are a highly skilled legal expert tasked with summarizing legal text. "
-                            "Please summarize the following chunk of legal text in a concise manner, "
-                            "highlighting the most critical information. Focus on key clauses, obligations, "
-                            "rights, and definitions. Do not omit any key details:\n\n{document}"
-                        )
-                        
-                        # Chain for summary
-                        chunk_chain = chunk_prompt | llm | parser
-                        chunk_summary = chunk_chain.invoke({"document": chunk.page_content})
-                        chunk_summaries.append(chunk_summary)
-                        
-                        # Update progress
-                        progress_bar.progress((i + 1) / total_chunks)
-                        
-                        # Add a small delay to avoid rate limiting
-                        time.sleep(0.5)
-                        
-                except Exception as e:
-                    print("Error analyzing chunks", e)
-                    st.error(f"Error analyzing chunks: {e}")
-                    st.stop()
-                    
-            # Final summary
-            with st.spinner("Creating final summary..."):
-                try:
-                    # Process summaries in batches to stay within token limits
-                    batch_size = 5  # Adjust based on your content size
-                    batched_summaries = []
-                    
-                    for i in range(0, len(chunk_summaries), batch_size):
-                        batch = chunk_summaries[i:i+batch_size]
-                        combined_batch = "\n\n".join(batch)
-                        
-                        # Create intermediate summary prompt
-                        intermediate_summary_prompt = ChatPromptTemplate.from_template(
-                            "You are a senior legal expert tasked with creating a concise summary from these "
-                            "document summaries. Combine these summaries into a cohesive and "
-                            "comprehensive summary:\n\n{document}"
-                        )
-                        
-                        # Generate intermediate summary
-                        intermediate_summary_chain = intermediate_summary_prompt | llm | parser
-                        intermediate_summary = intermediate_summary_chain.invoke({"document": combined_batch})
-                        batched_summaries.append(intermediate_summary)
-                        
-                        # Add a small delay to avoid rate limiting
-                        time.sleep(1)
-                    
-                    # Final combination of batched summaries
-                    combined_batched_summaries = "\n\n".join(batched_summaries)
-                    
-                    # Create final summary prompt
-                    final_summary_prompt = ChatPromptTemplate.from_template(
-                        "You are a senior legal expert tasked with creating a final summary from summarized chunks "
-                        "of a legal document. Combine the key points from the provided summaries into a cohesive and "
-                        "comprehensive summary. The final summary should be organized by key sections (e.g., Parties, "
-                        "Definitions, Obligations, Rights, Term & Termination, etc.) and be detailed enough to capture "
-                        "the main legal implications:\n\n{document}"
-                    )
-                    
-                    # Generate final summary
-                    final_summary_chain = final_summary_prompt | llm | parser
-                    final_summary = final_summary_chain.invoke({"document": combined_batched_summaries})
-                    
-                    # Store results in session state
-                    st.session_state["final_summary"] = final_summary
-                    
-                    # Display results
-                    st.subheader("Document Summary")
-                    st.write(final_summary)
-                    
-                    def create_summary_pdf(summary_content):
-                        pdf = FPDF()
-                        
-                        # Add summary page
-                        pdf.add_page()
-                        pdf.set_font("Arial", "B", 16)
-                        pdf.cell(0, 10, "Legal Document Summary", ln=True, align="C")
-                        pdf.ln(10)
-                        
-                        pdf.set_font("Arial", size=12)
-                        lines = summary_content.split('\n')
-                        for line in lines:
-                            # Replace any non-latin1 characters
-                            safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                            pdf.multi_cell(0, 10, txt=safe_line)
-                        
-                        return pdf.output(dest="S").encode("latin-1")
-                    
-                    # Download summary report
-                    summary_pdf_data = create_summary_pdf(final_summary)
-                    st.download_button(
-                        label="Download Summary",
-                        data=summary_pdf_data,
-                        file_name="legal_document_summary.pdf",
-                        mime="application/pdf"
-                    )
-                except Exception as e:
-                    print("Error creating final summary", e)
-                    st.error(f"Error creating final summary: {e}")
+    summary_running = "summary" in st.session_state["jobs"]
+    if st.button("Summarize", disabled=summary_running):
+        if st.session_state["document"]:
+            # The analysis runs as a background job, so reruns and reconnects
+            # don't throw the work away
+            start_job("summary")
+            summary_running = True
         else:
             st.error("Please upload a file first!")
 
+    if summary_running:
+        st.subheader("Document Summary")
+        follow_job("summary")
+    elif "summary" in st.session_state["job_errors"]:
+        st.error(f"Error creating final summary: {st.session_state['job_errors']['summary']}")
+    elif st.session_state["final_summary"]:
+        final_summary = st.session_state["final_summary"]
+        st.subheader("Document Summary")
+        st.write(final_summary)
+        download_report(
+            "Download Summary",
+            "legal_document_summary.pdf",
+            [(SUMMARY_TITLE, final_summary)],
+            "summary",
+        )
+        show_performance("summary")
+
 with tab2:
     # heading
     st.title("Legal Document QnA")
@@ -218,32 +343,52 @@ with tab2:
             st.write(user_question)
             
         # Generate response
-        with st.chat_message("assistant"):
-            with st.spinner("Analyzing..."):
-                if st.session_state["final_summary"] and st.session_state["risk_assessment"]:
-                    # Combine summary and risk assessment as context
-                    context = f"DOCUMENT SUMMARY:\n{st.session_state['final_summary']}\n\nRISK ASSESSMENT:\n{st.session_state['risk_assessment']}"
-                    
-                    # Create prompt with context
-                    chat_prompt = ChatPromptTemplate.from_template(
-                        "You are a legal assistant answering questions about a legal document. "
-                        "Use the following summary and risk assessment as context to answer the question "
-                        "with a cautious, precise legal perspective.\n\n"
-                        "CONTEXT: {context}\n\n"
-                        "QUESTION: {question}\n\n"
-                        "If the answer isn't clearly in the context, acknowledge that limitation and provide "
-                        "general legal information with appropriate disclaimers. Avoid making definitive "
-                        "legal conclusions without sufficient information."
+        with st.chat_message("assistant"), trace("qna") as run:
+            st.session_state["traces"]["qna"] = run
+            if st.session_state["document"]:
+                # The same or a similar question about the same document, summary
+                # and risk assessment may have been answered before, in any session
+                context_key = answer_context_key(
+                    runner.model_name,
+                    st.session_state["document"].key,
+                    st.session_state["final_summary"],
+                    st.session_state["risk_assessment"],
+                )
+                response, match = None, None
+                if answer_cache is not None:
+                    with span("qna.answer_cache") as cache_span:
+                        response, match = answer_cache.get(context_key, user_question)
+                        cache_span.set("cache_hits", int(response is not None))
+
+                if response is not None:
+                    st.write(response)
+                    if match == "similar":
+                        st.caption("Answered from a similar question asked earlier about this document.")
+                    else:
+                        st.caption("Answered from the same question asked earlier about this document.")
+                else:
+                    # Relevant excerpts of the document, plus the summary and risk
+                    # assessment if they have been generated
+                    index = get_index(st.session_state["document"], key=st.session_state["document"].key)
+                    context = build_context(
+                        index,
+                        user_question,
+                        summary=st.session_state["final_summary"],
+                        risk_assessment=st.session_state["risk_assessment"],
+                        k=config.QNA_TOP_K,
                     )
-                    chat_chain = chat_prompt | llm | parser
-                    response = chat_chain.invoke({
+
+                    # Stream the answer to the question with the context
+                    response = stream_with_timing(runner.stream(prompts.CHAT_PROMPT, {
                         "context": context,
                         "question": user_question
-                    })
-                else:
-                    response = "Please analyze a legal document in the Summary tab and generate a risk assessment in the Risk Assessment tab first."
-                
+                    }, use_cache=False), "chat")
+                    if answer_cache is not None and response:
+                        answer_cache.put(context_key, user_question, response)
+            else:
+                response = "Please upload a legal document in the Summary tab first."
                 st.write(response)
+        show_performance("qna")
                 
         # Add assistant response to chat history
         st.session_state["messages"].append({"role": "assistant", "content": response})
@@ -255,290 +400,57 @@ with tab3:
     st.divider()
     
     # Check if document has been uploaded
-    if "chunks" not in st.session_state or not st.session_state["chunks"]:
-        st.warning("Please upload a document in the Summary tab first.")
-    else:
-        # Risk Assessment Generation
-        if st.button("Generate Risk Assessment"):
-            with st.spinner("Analyzing risks in document chunks..."):
-                try:
-                    chunk_risks = []
-                    
-                    # Display progress
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    total_chunks = len(st.session_state["chunks"])
-                    
-                    for i, chunk in enumerate(st.session_state["chunks"]):
-                        status_text.text(f"Processing chunk {i+1} of {total_chunks}")
-                        
-                        # Risk assessment prompt
-                        risk_prompt = ChatPromptTemplate.from_template(
-                            "You are a legal risk assessment expert. Review the following chunk of legal text "
-                            "and identify potential legal risks, including but not limited to:\n"
-                            "1. Ambiguous or vague terms\n"
-                            "2. Compliance gaps or regulatory issues\n"
-                            "3. Contradictory clauses\n"
-                            "4. Missing essential terms\n"
-                            "5. Unfavorable indemnification clauses\n"
-                            "6. Liability exposures\n"
-                            "7. Termination vulnerabilities\n\n"
-                            "For each identified risk, specify the clause or section, explain the issue, "
-                            "and provide a severity assessment (Low, Medium, High).\n\n"
-                            "TEXT TO ANALYZE:\n{document}"
-                        )
-                        
-                        # Chain for risk assessment
-                        risk_chain = risk_prompt | llm | parser
-                        chunk_risk = risk_chain.invoke({"document": chunk.page_content})
-                        chunk_risks.append(chunk_risk)
-                        
-                        # Update progress
-                        progress_bar.progress((i + 1) / total_chunks)
-                        
-                        # Add a delay to avoid rate limiting
-                        time.sleep(1)
-                        
-                except Exception as e:
-                    print("Error analyzing risks", e)
-                    st.error(f"Error analyzing risks: {e}")
-                    st.stop()
-                    
-                # Create final risk assessment
-                with st.spinner("Creating final risk assessment..."):
-                    try:
-                        # Process risks in batches to stay within token limits
-                        batch_size = 3  # Use a smaller batch size for risk assessments
-                        batched_risks = []
-                        
-                        status_text.text("Processing risk batches...")
-                        batch_progress = st.progress(0)
-                        num_batches = (len(chunk_risks) + batch_size - 1) // batch_size
-                        
-                        for i in range(0, len(chunk_risks), batch_size):
-                            batch = chunk_risks[i:i+batch_size]
-                            combined_batch = "\n---\n".join(batch)
-                            
-                            # Create intermediate risk assessment prompt
-                            intermediate_risk_prompt = ChatPromptTemplate.from_template(
-                                "You are a legal risk assessment expert tasked with creating a concise risk report "
-                                "from individual risk assessments. Combine these risk assessments, eliminate duplicates, "
-                                "and prioritize by severity:\n\n{document}"
-                            )
-                            
-                            # Generate intermediate risk assessment
-                            intermediate_risk_chain = intermediate_risk_prompt | llm | parser
-                            intermediate_risk = intermediate_risk_chain.invoke({"document": combined_batch})
-                            batched_risks.append(intermediate_risk)
-                            
-                            # Update batch progress
-                            batch_progress.progress((i + batch_size) / len(chunk_risks))
-                            
-                            # Add a delay to avoid rate limiting
-                            time.sleep(1.5)
-                        
-                        # Process batched risks in smaller groups if there are many
-                        if len(batched_risks) > 2:
-                            status_text.text("Combining intermediate risk assessments...")
-                            secondary_batched_risks = []
-                            secondary_batch_size = 2
-                            
-                            for i in range(0, len(batched_risks), secondary_batch_size):
-                                batch = batched_risks[i:i+secondary_batch_size]
-                                combined_batch = "\n\n".join(batch)
-                                
-                                # Create secondary intermediate risk prompt
-                                secondary_risk_prompt = ChatPromptTemplate.from_template(
-                                    "You are a legal risk assessment expert. Combine these risk assessments "
-                                    "into a single cohesive report, eliminating duplicates and organizing by category:\n\n{document}"
-                                )
-                                
-                                # Generate secondary intermediate risk assessment
-                                secondary_risk_chain = secondary_risk_prompt | llm | parser
-                                secondary_risk = secondary_risk_chain.invoke({"document": combined_batch})
-                                secondary_batched_risks.append(secondary_risk)
-                                
-                                # Add a delay to avoid rate limiting
-                                time.sleep(1.5)
-                            
-                            combined_risks = "\n\n".join(secondary_batched_risks)
-                        else:
-                            # Combine batched risks directly if there are few enough
-                            combined_risks = "\n\n".join(batched_risks)
-                        
-                        status_text.text("Creating final risk assessment report...")
-                        
-                        # Create final risk assessment prompt
-                        final_risk_prompt = ChatPromptTemplate.from_template(
-                            "You are a legal risk assessment expert tasked with creating a comprehensive risk report "
-                            "from risk assessments of document chunks. Create a consolidated risk report "
-                            "that categorizes and prioritizes the identified risks. Focus on:\n"
-                            "1. Group related risks by category (e.g., Compliance, Liability, Ambiguity)\n"
-                            "2. Prioritize risks by severity\n"
-                            "3. Provide specific mitigation recommendations\n\n"
-                            "Format the report with clear sections, bullet points for individual risks, and "
-                            "a summary risk profile (Low, Medium, or High) for the overall document.\n\n"
-                            "INPUT RISK ASSESSMENTS:\n{document}"
-                        )
-                        
-                        # Generate final risk assessment
-                        final_risk_chain = final_risk_prompt | llm | parser
-                        final_risk_assessment = final_risk_chain.invoke({"document": combined_risks})
-                        
-                        # Store results in session state
-                        st.session_state["risk_assessment"] = final_risk_assessment
-                        
-                        # Hide progress indicators
-                        status_text.empty()
-                        
-                        # Display results
-                        st.subheader("Risk Assessment")
-                        st.write(final_risk_assessment)
-                        
-                        # Create PDF function for risk assessment
-                        def create_risk_pdf(risk_content):
-                            pdf = FPDF()
-                            
-                            # Add risk assessment page
-                            pdf.add_page()
-                            pdf.set_font("Arial", "B", 16)
-                            pdf.cell(0, 10, "Risk Assessment Report", ln=True, align="C")
-                            pdf.ln(10)
-                            
-                            pdf.set_font("Arial", size=12)
-                            risk_lines = risk_content.split('\n')
-                            for line in risk_lines:
-                                # Replace any non-latin1 characters
-                                safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                                pdf.multi_cell(0, 10, txt=safe_line)
-                                
-                            return pdf.output(dest="S").encode("latin-1")
-                        
-                        # Download risk assessment report
-                        risk_pdf_data = create_risk_pdf(final_risk_assessment)
-                        st.download_button(
-                            label="Download Risk Assessment",
-                            data=risk_pdf_data,
-                            file_name="legal_document_risk_assessment.pdf",
-                            mime="application/pdf"
-                        )
-                        
-                        # Create combined PDF function
-                        def create_combined_pdf(summary_content, risk_content):
-                            pdf = FPDF()
-                            
-                            # Add summary page
-                            pdf.add_page()
-                            pdf.set_font("Arial", "B", 16)
-                            pdf.cell(0, 10, "Legal Document Summary", ln=True, align="C")
-                            pdf.ln(10)
-                            
-                            pdf.set_font("Arial", size=12)
-                            summary_lines = summary_content.split('\n')
-                            for line in summary_lines:
-                                # Replace any non-latin1 characters
-                                safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                                pdf.multi_cell(0, 10, txt=safe_line)
-                            
-                            # Add risk assessment page
-                            pdf.add_page()
-                            pdf.set_font("Arial", "B", 16)
-                            pdf.cell(0, 10, "Risk Assessment Report", ln=True, align="C")
-                            pdf.ln(10)
-                            
-                            pdf.set_font("Arial", size=12)
-                            risk_lines = risk_content.split('\n')
-                            for line in risk_lines:
-                                # Replace any non-latin1 characters
-                                safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                                pdf.multi_cell(0, 10, txt=safe_line)
-                                
-                            return pdf.output(dest="S").encode("latin-1")
-                        
-                        # Download combined report if summary exists
-                        if st.session_state["final_summary"]:
-                            combined_pdf_data = create_combined_pdf(st.session_state["final_summary"], final_risk_assessment)
-                            st.download_button(
-                                label="Download Complete Analysis",
-                                data=combined_pdf_data,
-                                file_name="legal_document_complete_analysis.pdf",
-                                mime="application/pdf"
-                            )
-                    except Exception as e:
-                        print("Error creating final risk assessment", e)
-                        st.error(f"Error creating final risk assessment: {e}")
-        
-        # Show existing risk assessment if available
-        elif "risk_assessment" in st.session_state and st.session_state["risk_assessment"]:
-            st.subheader("Risk Assessment")
-            st.write(st.session_state["risk_assessment"])
-            
-            # Create PDF function for existing risk assessment
-            def create_risk_pdf(risk_content):
-                pdf = FPDF()
-                
-                # Add risk assessment page
-                pdf.add_page()
-                pdf.set_font("Arial", "B", 16)
-                pdf.cell(0, 10, "Risk Assessment Report", ln=True, align="C")
-                pdf.ln(10)
-                
-                pdf.set_font("Arial", size=12)
-                risk_lines = risk_content.split('\n')
-                for line in risk_lines:
-                    # Replace any non-latin1 characters
-                    safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                    pdf.multi_cell(0, 10, txt=safe_line)
-                    
-                return pdf.output(dest="S").encode("latin-1")
-            
-            # Download button for existing risk assessment
-            risk_pdf_data = create_risk_pdf(st.session_state["risk_assessment"])
-            st.download_button(
-                label="Download Risk Assessment",
-                data=risk_pdf_data,
-                file_name="legal_document_risk_assessment.pdf",
-                mime="application/pdf"
+    risk_running = "risk assessment" in st.session_state["jobs"]
+    if not st.session_state["document"]:
+        if not risk_running:
+            st.warning("Please upload a document in the Summary tab first.")
+    # Risk Assessment Generation, as a background job like the summary
+    elif st.button("Generate Risk Assessment", disabled=risk_running):
+        start_job("risk assessment")
+        risk_running = True
+
+    if risk_running:
+        st.subheader("Risk Assessment")
+        follow_job("risk assessment")
+    elif "risk assessment" in st.session_state["job_errors"]:
+        st.error(f"Error creating final risk assessment: {st.session_state['job_errors']['risk assessment']}")
+    # Show the risk assessment if available
+    elif "risk_assessment" in st.session_state and st.session_state["risk_assessment"]:
+        st.subheader("Risk Assessment")
+        st.write(st.session_state["risk_assessment"])
+        if st.session_state.get("risk_screened"):
+            screened, total = st.session_state["risk_screened"]
+            st.caption(f"Pre-screen: {screened} of {total} chunks ({screened / total:.0%}) had no "
+                       f"risk-bearing content and were not sent to the model.")
+
+        risk_assessment = st.session_state["risk_assessment"]
+        download_report(
+            "Download Risk Assessment",
+            "legal_document_risk_assessment.pdf",
+            [(RISK_TITLE, risk_assessment)],
+            "risk assessment",
+        )
+        if st.session_state["final_summary"]:
+            download_report(
+                "Download Complete Analysis",
+                "legal_document_complete_analysis.pdf",
+                [(SUMMARY_TITLE, st.session_state["final_summary"]), (RISK_TITLE, risk_assessment)],
+                "complete analysis",
             )
-            
-            # Combined PDF if summary exists
-            if "final_summary" in st.session_state and st.session_state["final_summary"]:
-                def create_combined_pdf(summary_content, risk_content):
-                    pdf = FPDF()
-                    
-                    # Add summary page
-                    pdf.add_page()
-                    pdf.set_font("Arial", "B", 16)
-                    pdf.cell(0, 10, "Legal Document Summary", ln=True, align="C")
-                    pdf.ln(10)
-                    
-                    pdf.set_font("Arial", size=12)
-                    summary_lines = summary_content.split('\n')
-                    for line in summary_lines:
-                        # Replace any non-latin1 characters
-                        safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                        pdf.multi_cell(0, 10, txt=safe_line)
-                    
-                    # Add risk assessment page
-                    pdf.add_page()
-                    pdf.set_font("Arial", "B", 16)
-                    pdf.cell(0, 10, "Risk Assessment Report", ln=True, align="C")
-                    pdf.ln(10)
-                    
-                    pdf.set_font("Arial", size=12)
-                    risk_lines = risk_content.split('\n')
-                    for line in risk_lines:
-                        # Replace any non-latin1 characters
-                        safe_line = ''.join(c if ord(c) < 256 else ' ' for c in line)
-                        pdf.multi_cell(0, 10, txt=safe_line)
-                        
-                    return pdf.output(dest="S").encode("latin-1")
-                
-                # Download combined report
-                combined_pdf_data = create_combined_pdf(st.session_state["final_summary"], st.session_state["risk_assessment"])
-                st.download_button(
-                    label="Download Complete Analysis",
-                    data=combined_pdf_data,
-                    file_name="legal_document_complete_analysis.pdf",
-                    mime="application/pdf"
-                )
+        show_performance("risk assessment")
+
+# Cache statistics for this server process
+cache = get_shared_cache()
+if cache is not None:
+    cache_stats = cache.stats()
+    st.sidebar.caption(
+        f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['entries']} entries"
+    )
+if answer_cache is not None:
+    answer_stats = answer_cache.stats()
+    st.sidebar.caption(
+        f"QnA answers: {answer_stats['hits']} repeated and {answer_stats['similar_hits']} similar questions "
+        f"answered from {answer_stats['entries']} cached answers, {answer_stats['misses']} sent to the model "
+        f"({answer_stats['hit_rate']:.0%} hit rate)"
+    )
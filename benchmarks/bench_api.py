@@ -0,0 +1,165 @@
+"""Load test the HTTP analysis API.
+
+    python -m benchmarks.bench_api --documents 4 --requests 400 --concurrency 32
+
+Uploads synthetic contracts, then sends summary, risk and question requests
+for them from concurrent clients and reports p50/p95 latency per operation and
+the requests per second. Without --url the API is started in this process
+against the fake LLM backend, with no LLM cache and no rate limits, so only
+coalescing and the API's own result caches save work. Uploads turned away
+with a 503 are retried, other requests are counted as rejected, and requests
+whose connection fails as errors.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from benchmarks.contracts import make_contract
+from legal_analyzer import config
+
+OPERATIONS = ["summary", "risks", "questions"]
+
+QUESTIONS = [
+    "What is the termination notice period?",
+    "Which law governs the agreement?",
+    "Who has to indemnify whom?",
+    "Is liability for consequential damages excluded?",
+    "When are invoices payable?",
+]
+
+
+def start_local_server(args):
+    # The API in a background thread of this process, against the fake model
+    config.LLM_BACKEND = "fake"
+    config.FAKE_LLM_LATENCY = args.latency
+    config.CACHE_PATH = ""
+    config.TRACE_LOG_PATH = ""
+    config.REQUESTS_PER_MINUTE = 10**9
+    config.TOKENS_PER_MINUTE = 10**12
+    from legal_analyzer.server import AnalysisService, create_server
+
+    server = create_server("127.0.0.1", 0, AnalysisService(max_workers=args.workers, max_queue=args.max_queue))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running API, by default one is started here")
+    parser.add_argument("--documents", type=int, default=4, help="Distinct documents requests are spread over")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per document")
+    parser.add_argument("--requests", type=int, default=400, help="Requests after the uploads")
+    parser.add_argument("--concurrency", type=int, default=32, help="Clients sending requests at the same time")
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="Comma separated operations to send")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM seconds per call (local API)")
+    parser.add_argument("--workers", type=int, default=config.API_WORKERS, help="API workers (local API)")
+    parser.add_argument("--max-queue", type=int, default=config.API_MAX_QUEUE, help="API queue size (local API)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_local_server(args)
+
+    clients = threading.local()
+
+    def client():
+        if not hasattr(clients, "client"):
+            clients.client = httpx.Client(base_url=url, timeout=None)
+        return clients.client
+
+    def timed(operation, method, path, retry=False, **kwargs):
+        # With retry, requests turned away are sent again after Retry-After. A
+        # connection that fails is counted as an error with status 0.
+        start = time.perf_counter()
+        try:
+            response = client().request(method, path, **kwargs)
+            while retry and response.status_code == 503:
+                time.sleep(float(response.headers.get("Retry-After", "1")))
+                response = client().request(method, path, **kwargs)
+        except httpx.TransportError as e:
+            return operation, 0, time.perf_counter() - start, e
+        return operation, response.status_code, time.perf_counter() - start, response
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            uploads = [
+                pool.submit(
+                    timed, "upload", "POST", f"/documents?name=contract-{seed}.txt",
+                    content="\n\n".join(doc.page_content for doc in make_contract(args.pages, seed=seed)),
+                    headers={"Content-Type": "text/plain"},
+                    retry=True,
+                )
+                for seed in range(args.documents)
+            ]
+            samples = [future.result() for future in uploads]
+            document_ids = []
+            for _, status, _, response in samples:
+                if status != 201:
+                    error = response.text if status else repr(response)
+                    raise SystemExit(f"Upload failed with {status}: {error}")
+                document_ids.append(response.json()["document_id"])
+
+            rng = random.Random(0)
+            operations = args.operations.split(",")
+            start = time.perf_counter()
+            futures = []
+            for _ in range(args.requests):
+                operation = rng.choice(operations)
+                path = f"/documents/{rng.choice(document_ids)}/{operation}"
+                body = {"question": rng.choice(QUESTIONS)} if operation == "questions" else None
+                futures.append(pool.submit(timed, operation, "POST", path, json=body))
+            samples += [future.result() for future in futures]
+            elapsed = time.perf_counter() - start
+
+        stats = client().get("/health").json()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    results = []
+    print(f"{'operation':<10} {'requests':>8} {'ok':>6} {'rejected':>8} {'errors':>6} "
+          f"{'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+    for operation in ["upload"] + operations:
+        rows = [sample for sample in samples if sample[0] == operation]
+        latencies = [seconds for _, status, seconds, _ in rows if 0 < status < 400]
+        result = {
+            "operation": operation,
+            "requests": len(rows),
+            "ok": len(latencies),
+            "rejected": sum(1 for _, status, _, _ in rows if status == 503),
+            "errors": sum(1 for _, status, _, _ in rows if status == 0 or status >= 400 and status != 503),
+            "p50_seconds": round(percentile(latencies, 0.5), 4),
+            "p95_seconds": round(percentile(latencies, 0.95), 4),
+            "max_seconds": round(max(latencies, default=0.0), 4),
+        }
+        results.append(result)
+        print(f"{operation:<10} {result['requests']:>8} {result['ok']:>6} {result['rejected']:>8} "
+              f"{result['errors']:>6} {result['p50_seconds']:>8.3f} {result['p95_seconds']:>8.3f} "
+              f"{result['max_seconds']:>8.3f}")
+    print(f"{args.requests / elapsed:.1f} requests/s over {elapsed:.2f}s. The API started "
+          f"{stats['started']} computations, {stats['coalesced']} requests joined one already in flight, "
+          f"{stats['rejected']} were turned away, {stats['llm']['calls']} LLM calls.")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"requests_per_second": round(args.requests / elapsed, 2), "server": stats,
+                       "operations": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
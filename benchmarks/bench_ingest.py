@@ -0,0 +1,100 @@
+"""Benchmark reading an uploaded PDF into chunks.
+
+    python -m benchmarks.bench_ingest --pages 50,300 --workers 4
+
+loader      the former path: write the upload to a file, PyPDFLoader.load()
+            every page, then split
+serial      pages read from memory one after the other, chunks streamed
+parallel    pages read from memory across the page pool, chunks streamed
+
+"first chunk" is when the map phase can send its first request.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fpdf import FPDF
+
+from benchmarks.contracts import make_contract
+from legal_analyzer import config
+from legal_analyzer.chunking import split_documents
+from legal_analyzer.ingest import get_page_pool, iter_document_chunks, iter_pages
+
+
+def make_pdf(pages):
+    # The synthetic contract as PDF bytes, one contract page per PDF page
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=9)
+    for doc in make_contract(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 4, doc.page_content)
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def loader_path(data):
+    from langchain_community.document_loaders import PyPDFLoader
+
+    start = time.perf_counter()
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        chunks = split_documents(PyPDFLoader(path).load())
+    finally:
+        os.remove(path)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(chunks)
+
+
+def streamed_path(data, workers):
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in iter_document_chunks(iter_pages(data, "bench.pdf", "application/pdf", workers=workers)):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    return first, time.perf_counter() - start, count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="50,300", help="Comma separated PDF sizes in pages")
+    parser.add_argument("--workers", type=int, default=config.INGEST_WORKERS, help="Page pool processes")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    config.INGEST_WORKERS = args.workers
+    # Start the pool up front, its start-up is paid once per server process
+    get_page_pool().submit(int).result()
+
+    paths = {
+        "loader": loader_path,
+        "serial": lambda data: streamed_path(data, 1),
+        "parallel": lambda data: streamed_path(data, args.workers),
+    }
+    results = []
+    print(f"{'path':<10} {'pages':>6} {'chunks':>6} {'first chunk s':>14} {'all chunks s':>13}")
+    for pages in [int(value) for value in args.pages.split(",")]:
+        data = make_pdf(pages)
+        for name, path in paths.items():
+            first, total, chunks = path(data)
+            results.append({
+                "path": name,
+                "pages": pages,
+                "chunks": chunks,
+                "first_chunk_seconds": round(first, 3),
+                "all_chunks_seconds": round(total, 3),
+            })
+            print(f"{name:<10} {pages:>6} {chunks:>6} {first:>14.2f} {total:>13.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Measure the fixed costs around the LLM calls, without the calls themselves.
+
+    python -m benchmarks.bench_overhead --calls 2000 --requests 200
+
+startup     building a runner with all pipeline chains, and a Groq client with
+            its own HTTP client versus one sharing the pooled client
+per call    building the prompt, chain and parser for every call (as the app
+            used to) versus the runner's prebuilt chains, over a zero-latency
+            fake model
+http        a new HTTP client per request versus the shared keep-alive pool,
+            against a local HTTP server
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from legal_analyzer import prompts
+from legal_analyzer.backends import FakeChatModel, get_http_client
+from legal_analyzer.runner import LLMRunner
+
+INPUTS = {"document": "4.2 The Supplier shall indemnify the Customer against all claims. " * 20}
+
+
+def per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_startup(repeat):
+    results = {
+        "runner_with_chains_ms": per_call(lambda: LLMRunner(FakeChatModel(), "fake"), repeat) * 1000,
+    }
+    try:
+        from langchain_groq import ChatGroq
+    except ImportError:
+        return results
+    results["groq_client_own_http_ms"] = per_call(
+        lambda: ChatGroq(model="fake", api_key="benchmark"), repeat) * 1000
+    http_client = get_http_client()
+    results["groq_client_shared_http_ms"] = per_call(
+        lambda: ChatGroq(model="fake", api_key="benchmark", http_client=http_client), repeat) * 1000
+    return results
+
+
+def bench_per_call(calls):
+    llm = FakeChatModel()
+    runner = LLMRunner(llm, llm.model_name)
+
+    def rebuilt():
+        chain = ChatPromptTemplate.from_template(prompts.CHUNK_SUMMARY_PROMPT) | llm | StrOutputParser()
+        chain.invoke(INPUTS)
+
+    def shared():
+        runner.invoke(prompts.CHUNK_SUMMARY_PROMPT, INPUTS, use_cache=False)
+
+    def bare():
+        llm.invoke(prompts.CHUNK_SUMMARY_PROMPT.format(**INPUTS))
+
+    return {
+        "bare_model_us": per_call(bare, calls) * 1e6,
+        "rebuilt_chain_us": per_call(rebuilt, calls) * 1e6,
+        "shared_runner_us": per_call(shared, calls) * 1e6,
+    }
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, without this every response
+    # waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_http(requests):
+    import httpx
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        def new_client():
+            with httpx.Client() as client:
+                client.get(url)
+
+        pooled = get_http_client()
+        return {
+            "new_client_ms": per_call(new_client, requests) * 1000,
+            "pooled_client_ms": per_call(lambda: pooled.get(url), requests) * 1000,
+        }
+    finally:
+        server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--startup", type=int, default=20, help="Clients and runners to build")
+    parser.add_argument("--calls", type=int, default=2000, help="Calls to the fake model")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to the local HTTP server")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {
+        "startup": bench_startup(args.startup),
+        "per_call": bench_per_call(args.calls),
+        "http": bench_http(args.requests),
+    }
+    for group, values in results.items():
+        for name, value in values.items():
+            print(f"{group:<10} {name:<28} {value:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
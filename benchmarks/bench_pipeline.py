@@ -0,0 +1,134 @@
+"""Benchmark the analysis flows offline against the fake LLM backend.
+
+    python -m benchmarks.bench_pipeline --pages 10,100,1000 --json bench.json
+
+Reports wall time, LLM calls, tokens in/out, peak memory and throughput of
+the summary, risk, single-pass and QnA flows over synthetic contracts. Run
+with --pack, and --chunk-tokens for small chunks, to compare chunk packing.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.contracts import make_contract
+from legal_analyzer import config, prompts
+from legal_analyzer.backends import FakeChatModel
+from legal_analyzer.chunking import split_documents
+from legal_analyzer.pipeline import (
+    analyze_chunks, assess_chunks, reduce_risks, reduce_summaries, summarize_chunks,
+)
+from legal_analyzer.ratelimit import RateLimiter
+from legal_analyzer.retrieval import build_context, get_index
+from legal_analyzer.runner import LLMRunner
+
+QUESTIONS = [
+    "What is the termination notice period?",
+    "Which law governs the agreement?",
+    "Who has to indemnify whom?",
+    "Is liability for consequential damages excluded?",
+    "When are invoices payable?",
+]
+
+
+def summary_flow(runner, texts):
+    reduce_summaries(runner, summarize_chunks(runner, texts))
+
+
+def risk_flow(runner, texts):
+    reduce_risks(runner, assess_chunks(runner, texts))
+
+
+def single_pass_flow(runner, texts):
+    chunk_summaries, chunk_risks = analyze_chunks(runner, texts)
+    reduce_summaries(runner, chunk_summaries)
+    reduce_risks(runner, chunk_risks)
+
+
+def qna_flow(runner, texts):
+    index = get_index(texts)
+    for question in QUESTIONS:
+        context = build_context(index, question, k=config.QNA_TOP_K)
+        runner.invoke(prompts.CHAT_PROMPT, {"context": context, "question": question}, use_cache=False)
+
+
+FLOWS = {
+    "summary": summary_flow,
+    "risk": risk_flow,
+    "single-pass": single_pass_flow,
+    "qna": qna_flow,
+}
+
+
+def run_flow(name, flow, pages, texts, llm, limiter):
+    # The runner has no cache, every flow pays for all of its calls
+    runner = LLMRunner(llm, llm.model_name, limiter=limiter)
+    llm.reset_stats()
+    tracemalloc.start()
+    start = time.perf_counter()
+    flow(runner, texts)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = llm.stats()
+    return {
+        "flow": name,
+        "pages": pages,
+        "chunks": len(texts),
+        "seconds": round(elapsed, 3),
+        "llm_calls": stats["calls"],
+        "rate_limited": stats["rate_limited"],
+        "tokens_in": stats["tokens_in"],
+        "tokens_out": stats["tokens_out"],
+        "peak_memory_mb": round(peak / 2**20, 2),
+        "pages_per_second": round(pages / elapsed, 2),
+        "tokens_per_second": round((stats["tokens_in"] + stats["tokens_out"]) / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,100,1000", help="Comma separated contract sizes in pages")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="Comma separated flows to run")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM seconds per call")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Fake LLM output speed")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Fail every n-th call with a 429")
+    parser.add_argument("--concurrency", type=int, default=config.MAX_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute quota, 0 for no limiter")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute quota, used with --rpm")
+    parser.add_argument("--pack", action="store_true", help="Pack several small chunks per map call")
+    parser.add_argument("--chunk-tokens", type=int, default=config.CHUNK_MAX_TOKENS, help="Largest chunk in tokens")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    config.MAX_CONCURRENCY = args.concurrency
+    config.PACK_CHUNKS = args.pack
+    config.CHUNK_MAX_TOKENS = args.chunk_tokens
+    llm = FakeChatModel(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_every=args.rate_limit_every,
+    )
+    limiter = RateLimiter(args.rpm, args.tpm or 10**9) if args.rpm else None
+
+    results = []
+    print(f"{'flow':<12} {'pages':>6} {'chunks':>6} {'seconds':>8} {'calls':>6} {'tok in':>9} {'tok out':>8} "
+          f"{'peak MB':>8} {'pages/s':>8} {'tok/s':>9}")
+    for pages in [int(value) for value in args.pages.split(",")]:
+        texts = [chunk.page_content for chunk in split_documents(make_contract(pages))]
+        for name in args.flows.split(","):
+            result = run_flow(name, FLOWS[name], pages, texts, llm, limiter)
+            results.append(result)
+            print(f"{name:<12} {pages:>6} {result['chunks']:>6} {result['seconds']:>8.2f} {result['llm_calls']:>6} "
+                  f"{result['tokens_in']:>9} {result['tokens_out']:>8} {result['peak_memory_mb']:>8.1f} "
+                  f"{result['pages_per_second']:>8.1f} {result['tokens_per_second']:>9.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
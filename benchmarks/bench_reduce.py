@@ -0,0 +1,135 @@
+"""Benchmark the summary reduce offline against the fake LLM backend.
+
+    python -m benchmarks.bench_reduce --chunks 10,100,1000
+
+baseline    the original reduce: intermediate summaries of fixed batches of 5
+            chunk summaries one after the other, then one final call over all
+            of them (without its 1s sleep after every batch)
+hashcut     the same with content-defined batches of about 5 summaries, which
+            the reduce used before tree_reduce
+tree        tree_reduce(): levels of concurrent intermediate calls with a
+            fan-in from the input sizes, until the rest fits the final call
+
+"depth" is the number of calls in sequence, "largest prompt" the input
+tokens of the biggest call, which neither batched reduce bounded.
+"""
+import argparse
+import hashlib
+import json
+import time
+
+from benchmarks.contracts import make_contract
+from legal_analyzer import config, prompts
+from legal_analyzer.backends import FakeChatModel, fake_answer
+from legal_analyzer.chunking import split_documents
+from legal_analyzer.mapper import estimate_request_tokens
+from legal_analyzer.pipeline import reduce_summaries
+from legal_analyzer.reduce import SEPARATOR
+from legal_analyzer.runner import LLMRunner
+
+
+class PromptSizes:
+    # Wraps a runner's invoke() to record the input tokens of every call
+    def __init__(self, runner):
+        self.runner = runner
+        self.largest = 0
+        invoke = runner.invoke
+
+        def record(template, inputs, use_cache=True):
+            self.largest = max(self.largest, estimate_request_tokens(inputs) - config.COMPLETION_TOKENS)
+            return invoke(template, inputs, use_cache=use_cache)
+
+        runner.invoke = record
+
+
+def make_summaries(count):
+    # Chunk summaries as the fake model writes them for a synthetic contract
+    texts = []
+    pages = 1
+    while len(texts) < count:
+        pages *= 2
+        texts = [chunk.page_content for chunk in split_documents(make_contract(pages))]
+    prompt = prompts.CHUNK_SUMMARY_PROMPT
+    return [fake_answer(prompt.format(document=text), config.COMPLETION_TOKENS) for text in texts[:count]]
+
+
+def fixed_batches(chunk_summaries, batch_size=5):
+    return [chunk_summaries[i:i + batch_size] for i in range(0, len(chunk_summaries), batch_size)]
+
+
+def hashcut_batches(chunk_summaries, batch_size=5):
+    # A batch ends after a summary whose hash is a multiple of batch_size, or
+    # at twice batch_size summaries
+    batches = [[]]
+    for summary in chunk_summaries:
+        batches[-1].append(summary)
+        digest = hashlib.sha256(summary.encode("utf-8")).digest()
+        if int.from_bytes(digest[:4], "big") % batch_size == 0 or len(batches[-1]) >= 2 * batch_size:
+            batches.append([])
+    return [batch for batch in batches if batch]
+
+
+def batched_reduce(runner, batches):
+    intermediate = [
+        runner.invoke(prompts.INTERMEDIATE_SUMMARY_PROMPT, {"document": SEPARATOR.join(batch)})
+        for batch in batches
+    ]
+    runner.invoke(prompts.FINAL_SUMMARY_PROMPT, {"document": SEPARATOR.join(intermediate)})
+    return len(batches) + 1
+
+
+def tree_reduce_depth(runner, chunk_summaries):
+    levels = []
+    reduce_summaries(runner, chunk_summaries, on_status=levels.append)
+    # One status per level plus the final call
+    return len(levels)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="10,100,1000", help="Comma separated numbers of chunk summaries")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM seconds per call")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Fake LLM output speed")
+    parser.add_argument("--concurrency", type=int, default=config.MAX_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    config.MAX_CONCURRENCY = args.concurrency
+    llm = FakeChatModel(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    paths = {
+        "baseline": lambda runner, summaries: batched_reduce(runner, fixed_batches(summaries)),
+        "hashcut": lambda runner, summaries: batched_reduce(runner, hashcut_batches(summaries)),
+        "tree": tree_reduce_depth,
+    }
+
+    results = []
+    print(f"{'path':<8} {'chunks':>6} {'calls':>6} {'depth':>6} {'largest prompt':>15} {'seconds':>8}")
+    for count in [int(value) for value in args.chunks.split(",")]:
+        chunk_summaries = make_summaries(count)
+        for name, path in paths.items():
+            # No cache, every path pays for all of its calls
+            runner = LLMRunner(llm, llm.model_name)
+            sizes = PromptSizes(runner)
+            llm.reset_stats()
+            start = time.perf_counter()
+            depth = path(runner, chunk_summaries)
+            elapsed = time.perf_counter() - start
+            result = {
+                "path": name,
+                "chunks": count,
+                "calls": llm.stats()["calls"],
+                "depth": depth,
+                "largest_prompt_tokens": sizes.largest,
+                "seconds": round(elapsed, 3),
+            }
+            results.append(result)
+            print(f"{name:<8} {count:>6} {result['calls']:>6} {depth:>6} {sizes.largest:>15} {elapsed:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark rendering the PDF reports.
+
+    python -m benchmarks.bench_reports --lines 200,2000
+
+inline      the former per-rerun path: render every time, filtering each
+            character in Python and blanking what Latin-1 can't hold
+latin-1     render_pdf() of a report that fits Latin-1 (core font)
+unicode     render_pdf() of a report with typographic quotes, dashes and
+            non-Latin text (embedded font)
+cached      report_pdf() of an unchanged report, as on every rerun
+"""
+import argparse
+import json
+import random
+import time
+
+from fpdf import FPDF
+
+from benchmarks.contracts import FILLER
+from legal_analyzer.reports import render_pdf, report_pdf
+
+
+def make_report(lines, unicode_text, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(lines):
+        words = " ".join(rng.choice(FILLER) for _ in range(rng.randint(8, 30)))
+        if unicode_text:
+            rows.append(f"- **High** (Section {i}.1): “{words}” — €{i * 100} § {i} 中文")
+        else:
+            rows.append(f"- **High** (Section {i}.1): \"{words}\" - EUR {i * 100}")
+    return "\n".join(rows)
+
+
+def inline_pdf(title, text):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, title, ln=True, align="C")
+    pdf.ln(10)
+    pdf.set_font("Arial", size=12)
+    for line in text.split("\n"):
+        safe_line = "".join(c if ord(c) < 256 else " " for c in line)
+        pdf.multi_cell(0, 10, txt=safe_line)
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def timed(func):
+    start = time.perf_counter()
+    data = func()
+    return time.perf_counter() - start, len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", default="200,2000", help="Comma separated report sizes in lines")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'path':<10} {'lines':>6} {'seconds':>9} {'kB':>8}")
+    for lines in [int(value) for value in args.lines.split(",")]:
+        plain = make_report(lines, unicode_text=False)
+        fancy = make_report(lines, unicode_text=True)
+        report_pdf([("Risk Assessment Report", fancy)])
+        paths = {
+            "inline": lambda: inline_pdf("Risk Assessment Report", fancy),
+            "latin-1": lambda: render_pdf([("Risk Assessment Report", plain)]),
+            "unicode": lambda: render_pdf([("Risk Assessment Report", fancy)]),
+            "cached": lambda: report_pdf([("Risk Assessment Report", fancy)]),
+        }
+        for name, func in paths.items():
+            seconds, size = timed(func)
+            results.append({"path": name, "lines": lines, "seconds": round(seconds, 4), "bytes": size})
+            print(f"{name:<10} {lines:>6} {seconds:>9.4f} {size / 1024:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import random
+
+from langchain_core.documents import Document
+
+PARTIES = ["Acme Corporation", "Globex Ltd", "Initech LLC", "Umbrella Holdings", "Stark Industries"]
+
+TOPICS = [
+    ("DEFINITIONS", "the following capitalized terms shall have the meanings set forth herein"),
+    ("TERM AND TERMINATION", "either party may terminate this Agreement upon thirty days written notice"),
+    ("INDEMNIFICATION", "the Supplier shall indemnify and hold harmless the Customer against all claims"),
+    ("LIMITATION OF LIABILITY", "in no event shall either party be liable for indirect or consequential damages"),
+    ("CONFIDENTIALITY", "each party shall keep the Confidential Information of the other party in strict confidence"),
+    ("GOVERNING LAW", "this Agreement shall be governed by the laws of the State of Delaware"),
+    ("PAYMENT TERMS", "all invoices are payable within forty-five days of receipt without set-off"),
+    ("DATA PROTECTION", "the Processor shall process Personal Data only on documented instructions"),
+]
+
+FILLER = (
+    "provided that such obligations survive expiry of this Agreement and any amendment thereto "
+    "is made in writing and signed by authorized representatives of both parties, save as "
+    "otherwise expressly agreed, notwithstanding anything to the contrary contained herein"
+).split()
+
+
+def table_of_contents(rng, pages):
+    lines = ["TABLE OF CONTENTS"]
+    for article in range(1, max(2, pages // 2)):
+        title, _ = rng.choice(TOPICS)
+        lines.append(f"ARTICLE {article} {title} {'.' * 20} {article * 2}")
+    return "\n".join(lines)
+
+
+def signature_page(parties):
+    lines = [
+        "NOTICES",
+        "Notices shall be sent to the following addresses:",
+    ]
+    for number, party in enumerate(parties, start=1):
+        lines.extend([
+            party,
+            "Attn: General Counsel",
+            f"{number * 100} Main Street, Suite {number * 10}",
+            f"Email: legal@{party.split()[0].lower()}.example",
+        ])
+    lines.append("IN WITNESS WHEREOF, the parties have caused this Agreement to be executed by their "
+                 "duly authorized representatives.")
+    for party in parties:
+        lines.extend([party, "By: ____________________", "Name:", "Title:", "Date:"])
+    return "\n".join(lines)
+
+
+def make_contract(pages, seed=0, chars_per_page=3000):
+    # Synthetic agreement of the given number of pages, loaded the way
+    # PyPDFLoader returns a PDF: one Document per page. Longer agreements
+    # start with a table of contents and end with notices and signature blocks.
+    rng = random.Random(seed)
+    parties = rng.sample(PARTIES, 2)
+    docs = []
+    article = 0
+    clause = 0
+    source = f"synthetic-{seed}.pdf"
+    boilerplate = pages >= 3
+    if boilerplate:
+        docs.append(Document(page_content=table_of_contents(rng, pages), metadata={"source": source, "page": 0}))
+    first = len(docs)
+    last = pages - 1 if boilerplate else pages
+    for page in range(first, last):
+        lines = []
+        if page == first:
+            lines.append(f"MASTER SERVICES AGREEMENT between {parties[0]} and {parties[1]}")
+        size = 0
+        while size < chars_per_page:
+            if clause == 0 or rng.random() < 0.15:
+                article += 1
+                clause = 0
+                title, _ = rng.choice(TOPICS)
+                line = f"ARTICLE {article}\n{title}"
+            else:
+                _, sentence = rng.choice(TOPICS)
+                filler = " ".join(rng.choice(FILLER) for _ in range(rng.randint(20, 60)))
+                line = f"{article}.{clause} {sentence.capitalize()}, {filler}."
+            clause += 1
+            lines.append(line)
+            size += len(line) + 1
+        docs.append(Document(page_content="\n".join(lines), metadata={"source": source, "page": page}))
+    if boilerplate:
+        docs.append(Document(page_content=signature_page(parties), metadata={"source": source, "page": pages - 1}))
+    return docs
@@ -0,0 +1 @@
+# Helpers shared by the Streamlit app for talking to the LLM provider
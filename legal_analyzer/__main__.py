@@ -0,0 +1,74 @@
+import argparse
+
+from legal_analyzer import config
+from legal_analyzer.batch import analyze_file, run_batch
+from legal_analyzer.runner import create_runner
+from legal_analyzer.server import AnalysisService, create_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m legal_analyzer", description="Headless legal document analysis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="Summarize and assess the risks of every document in a directory")
+    batch.add_argument("directory", help="Directory searched recursively for .pdf, .txt and .csv files")
+    batch.add_argument("--out", default="results.jsonl",
+                       help="JSON Lines results file, rerun with the same file to resume (default: results.jsonl)")
+    batch.add_argument("--parse-workers", type=int, default=None,
+                       help="Processes used to load and split documents (default: number of CPUs)")
+    batch.add_argument("--doc-workers", type=int, default=4,
+                       help="Documents analyzed at the same time (default: 4)")
+    batch.add_argument("--max-in-flight", type=int, default=config.MAX_CONCURRENCY,
+                       help=f"LLM calls in flight across all documents (default: {config.MAX_CONCURRENCY})")
+    batch.add_argument("--single-pass", action="store_true",
+                       help="Summarize and assess each chunk in one LLM call")
+    batch.add_argument("--pack", action="store_true", default=None,
+                       help="Send several small chunks per LLM call (default: PACK_CHUNKS)")
+
+    analyze = commands.add_parser("analyze", help="Summarize and assess the risks of one document")
+    analyze.add_argument("path", help="A .pdf, .txt or .csv file")
+    analyze.add_argument("--single-pass", action="store_true",
+                         help="Summarize and assess each chunk in one LLM call")
+    analyze.add_argument("--pack", action="store_true", default=None,
+                         help="Send several small chunks per LLM call (default: PACK_CHUNKS)")
+
+    serve = commands.add_parser("serve", help="Run the HTTP analysis API")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    serve.add_argument("--workers", type=int, default=config.API_WORKERS,
+                       help=f"Analyses run at the same time (default: {config.API_WORKERS})")
+    serve.add_argument("--max-queue", type=int, default=config.API_MAX_QUEUE,
+                       help=f"Analyses waiting before requests are turned away (default: {config.API_MAX_QUEUE})")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        runner = create_runner(max_in_flight=args.max_in_flight)
+        run_batch(
+            args.directory,
+            args.out,
+            runner,
+            parse_workers=args.parse_workers,
+            doc_workers=args.doc_workers,
+            single_pass=args.single_pass,
+            pack=args.pack,
+        )
+    elif args.command == "analyze":
+        summary, risk_assessment = analyze_file(
+            create_runner(), args.path, single_pass=args.single_pass, pack=args.pack
+        )
+        print(f"# Summary\n\n{summary}\n\n# Risk Assessment\n\n{risk_assessment}")
+    elif args.command == "serve":
+        server = create_server(
+            args.host, args.port, AnalysisService(max_workers=args.workers, max_queue=args.max_queue)
+        )
+        print(f"Serving the analysis API on http://{args.host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
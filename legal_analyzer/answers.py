@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from legal_analyzer import config
+from legal_analyzer.retrieval import STOPWORDS, TOKEN_PATTERN
+
+
+# Words that flip the meaning of a question, two questions only match when
+# they have the same ones. "t" is what is left of "can't" and "doesn't".
+NEGATION_TERMS = frozenset(["not", "no", "never", "nor", "cannot", "without", "except", "unless"])
+
+# Question words, kept although retrieval drops them as stopwords: "Who can
+# terminate the agreement?" and "When can the agreement terminate?" ask for
+# different answers. Two questions only match when they have the same ones.
+INTERROGATIVE_TERMS = frozenset(["who", "whom", "whose", "what", "when", "where", "which", "how", "why"])
+
+
+def normalize_question(question):
+    # "What is the  termination notice period?" -> "what is the termination notice period"
+    return " ".join(TOKEN_PATTERN.findall(question.lower()))
+
+
+def question_terms(question):
+    # The content and question words of a question with plurals folded, for
+    # matching paraphrases: "What's the notice period for termination?" and
+    # "what is the termination notice period" both give {"what", "notice",
+    # "period", "termination"}
+    terms = set()
+    for token in TOKEN_PATTERN.findall(question.lower()):
+        if token in STOPWORDS and token not in INTERROGATIVE_TERMS:
+            continue
+        if token == "t":
+            token = "not"
+        if len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.add(token)
+    return frozenset(terms)
+
+
+def similarity(terms, other_terms):
+    # Jaccard similarity of two term sets, 0 when only one of them is negated
+    # or they ask with different question words
+    if not terms or not other_terms:
+        return 0.0
+    for required in (NEGATION_TERMS, INTERROGATIVE_TERMS):
+        if terms & required != other_terms & required:
+            return 0.0
+    return len(terms & other_terms) / len(terms | other_terms)
+
+
+def answer_context_key(model_name, document_key, summary="", risk_assessment=""):
+    # An answer is only reused for the same model, document, summary and risk
+    # assessment, since those make up its context
+    digest = hashlib.sha256()
+    for value in (model_name, document_key, summary, risk_assessment):
+        digest.update(value.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    # Answers to QnA questions, shared by every session of the process. A
+    # question asked again about the same context, by anyone, is answered from
+    # here: exactly when its normalized text matches, or with min_similarity
+    # set, when its content words are close enough to a cached question's.
+    # Entries expire after ttl seconds, the least recently used ones are
+    # evicted beyond max_entries.
+    def __init__(self, max_entries=None, ttl=None, min_similarity=None):
+        self.max_entries = max_entries if max_entries is not None else config.QNA_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else config.QNA_CACHE_TTL_SECONDS
+        self.min_similarity = min_similarity if min_similarity is not None else config.QNA_CACHE_SIMILARITY
+        self.lock = threading.Lock()
+        # (context key, normalized question) -> (answer, created)
+        self.entries = OrderedDict()
+        # context key -> {normalized question: terms}, the candidates for a
+        # similar question
+        self.questions = defaultdict(dict)
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, context_key, question):
+        # (answer, "exact" or "similar"), or (None, None) on a miss
+        normalized = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            answer = self._lookup((context_key, normalized), now)
+            if answer is not None:
+                self.hits += 1
+                return answer, "exact"
+
+            if self.min_similarity:
+                terms = question_terms(question)
+                best, best_score = None, self.min_similarity
+                for other, other_terms in list(self.questions.get(context_key, {}).items()):
+                    score = similarity(terms, other_terms)
+                    if score >= best_score:
+                        best, best_score = other, score
+                if best is not None:
+                    answer = self._lookup((context_key, best), now)
+                    if answer is not None:
+                        self.similar_hits += 1
+                        return answer, "similar"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, context_key, question, answer):
+        normalized = normalize_question(question)
+        key = (context_key, normalized)
+        with self.lock:
+            self.entries[key] = (answer, time.time())
+            self.entries.move_to_end(key)
+            self.questions[context_key][normalized] = question_terms(question)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self._forget(evicted)
+                self.evictions += 1
+
+    def _lookup(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        answer, created = entry
+        if self.ttl and now - created > self.ttl:
+            del self.entries[key]
+            self._forget(key)
+            self.evictions += 1
+            return None
+        self.entries.move_to_end(key)
+        return answer
+
+    def _forget(self, key):
+        context_key, normalized = key
+        questions = self.questions.get(context_key)
+        if questions is not None:
+            questions.pop(normalized, None)
+            if not questions:
+                del self.questions[context_key]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "evictions": self.evictions,
+            }
+
+
+_shared_answers = None
+_answers_lock = threading.Lock()
+
+
+def get_answer_cache():
+    # One answer cache per process, or None when QNA_CACHE_MAX_ENTRIES is 0
+    global _shared_answers
+    with _answers_lock:
+        if _shared_answers is None and config.QNA_CACHE_MAX_ENTRIES:
+            _shared_answers = AnswerCache()
+        return _shared_answers
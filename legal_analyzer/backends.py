@@ -0,0 +1,173 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from legal_analyzer import config, prompts
+from legal_analyzer.ratelimit import estimate_tokens
+
+WORD_PATTERN = re.compile(r"[A-Za-z]{3,}")
+CLAUSE_PATTERN = re.compile(r"\b\d+(?:\.\d+)+\b")
+PACK_CHUNK_PATTERN = re.compile(r"^=== CHUNK \d+ ===\n", re.M)
+
+
+class FakeRateLimitError(Exception):
+    # Looks like the provider's 429 error to is_rate_limit_error
+    status_code = 429
+    response = None
+
+
+class FakeChatModel(BaseChatModel):
+    # Deterministic local stand-in for the provider. Answers are derived from a
+    # hash of the prompt and follow the format the prompt asks for, so the whole
+    # pipeline runs offline. latency is the fixed cost of a call in seconds,
+    # tokens_per_second paces the answer (0 answers instantly) and every
+    # rate_limit_every-th call fails with a 429 (0 never fails).
+    model_name: str = "fake"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    rate_limit_every: int = 0
+    max_output_tokens: int = 256
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _rate_limited: int = PrivateAttr(default=0)
+    _tokens_in: int = PrivateAttr(default=0)
+    _tokens_out: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "rate_limited": self._rate_limited,
+                "tokens_in": self._tokens_in,
+                "tokens_out": self._tokens_out,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._calls = self._rate_limited = self._tokens_in = self._tokens_out = 0
+
+    def _start_call(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        with self._lock:
+            self._calls += 1
+            if self.rate_limit_every and self._calls % self.rate_limit_every == 0:
+                self._rate_limited += 1
+                raise FakeRateLimitError("Rate limit reached (fake)")
+        answer = fake_answer(prompt, self.max_output_tokens)
+        tokens_in = estimate_tokens(prompt)
+        tokens_out = estimate_tokens(answer)
+        with self._lock:
+            self._tokens_in += tokens_in
+            self._tokens_out += tokens_out
+        time.sleep(self.latency)
+        usage = {"input_tokens": tokens_in, "output_tokens": tokens_out, "total_tokens": tokens_in + tokens_out}
+        return answer, usage
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        answer, usage = self._start_call(messages)
+        if self.tokens_per_second:
+            time.sleep(estimate_tokens(answer) / self.tokens_per_second)
+        message = AIMessage(content=answer, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        answer, usage = self._start_call(messages)
+        pieces = re.split(r"(\s+)", answer)
+        for piece in pieces:
+            if not piece:
+                continue
+            if self.tokens_per_second:
+                time.sleep(estimate_tokens(piece) / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+
+def fake_answer(prompt, max_output_tokens):
+    # Answer in the format the prompt asks for, built from words of the prompt.
+    # A packed prompt gets an answer section per chunk.
+    if prompts.PACKING_INSTRUCTIONS in prompt:
+        instructions, *chunks = PACK_CHUNK_PATTERN.split(prompt.replace(prompts.PACKING_INSTRUCTIONS, ""))
+        return "\n".join(
+            prompts.PACK_ANSWER_MARKER.format(number=number) + "\n" + fake_answer(instructions + text, max_output_tokens)
+            for number, text in enumerate(chunks, start=1)
+        )
+
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+    vocabulary = WORD_PATTERN.findall(prompt) or ["clause"]
+    clauses = CLAUSE_PATTERN.findall(prompt)
+    input_tokens = estimate_tokens(prompt)
+    length = max(8, min(max_output_tokens, input_tokens // 4))
+
+    def text(words):
+        return " ".join(rng.choice(vocabulary) for _ in range(words)) + "."
+
+    def risks():
+        records = []
+        for _ in range(rng.randint(0, 3)):
+            records.append({
+                "clause": f"Section {rng.choice(clauses)}" if clauses else "",
+                "category": rng.choice(prompts.RISK_CATEGORIES),
+                "severity": rng.choice(["Low", "Medium", "High"]),
+                "explanation": text(rng.randint(8, 20)),
+            })
+        return json.dumps(records)
+
+    if prompts.ANALYSIS_SUMMARY_MARKER in prompt:
+        return (f"{prompts.ANALYSIS_SUMMARY_MARKER}\n{text(length)}\n"
+                f"{prompts.ANALYSIS_RISKS_MARKER}\n{risks()}")
+    if prompts.RISK_RECORD_FORMAT in prompt:
+        return risks()
+    return text(length)
+
+
+_http_client = None
+_http_lock = threading.Lock()
+
+
+def get_http_client():
+    # One pooled keep-alive HTTP client per process, so every session and job
+    # reuses the open connections to the provider
+    global _http_client
+    with _http_lock:
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=config.HTTP_KEEPALIVE_SECONDS,
+            ))
+        return _http_client
+
+
+def create_llm(backend=None):
+    # Chat model of the configured backend: "groq" talks to the provider,
+    # "fake" runs the deterministic local model
+    backend = backend or config.LLM_BACKEND
+    if backend == "groq":
+        # Imported here so the fake backend works without the Groq client
+        from langchain_groq import ChatGroq
+
+        # Retries are left to call_with_backoff, which paces them with the
+        # shared rate limiter
+        return ChatGroq(model=config.MODEL_NAME, http_client=get_http_client(), max_retries=0)
+    if backend == "fake":
+        return FakeChatModel(
+            latency=config.FAKE_LLM_LATENCY,
+            tokens_per_second=config.FAKE_LLM_TOKENS_PER_SECOND,
+            rate_limit_every=config.FAKE_LLM_RATE_LIMIT_EVERY,
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from legal_analyzer.chunking import split_documents
+from legal_analyzer.ingest import get_format, iter_document_chunks, iter_pages
+from legal_analyzer.pipeline import analyze_document
+from legal_analyzer.tracing import trace
+
+
+def find_documents(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if get_format(path) is not None:
+                paths.append(path)
+    return sorted(paths)
+
+
+def read_manifest(out_path):
+    # Paths an earlier run already analyzed successfully into out_path
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Line cut short by an interrupted run
+                continue
+            if record.get("status") == "ok":
+                done.add(record["path"])
+    return done
+
+
+def parse_document(path):
+    # Load and split one file, runs in a worker process
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    # Documents are already parsed in parallel, each one is read by one process
+    docs = list(iter_pages(data, path, workers=1))
+    chunks = split_documents(docs)
+    return {
+        "path": path,
+        "sha256": sha256,
+        "pages": len(docs),
+        "texts": [chunk.page_content for chunk in chunks],
+        "parse_seconds": time.perf_counter() - start,
+    }
+
+
+def analyze_parsed(runner, parsed, single_pass=False, pack=None):
+    start = time.perf_counter()
+    with trace("batch.document", path=parsed["path"], parse_seconds=parsed["parse_seconds"]) as run:
+        summary, risk_assessment = analyze_document(runner, parsed["texts"], single_pass=single_pass, pack=pack)
+    stages = run.summary()
+    llm_rows = [row for row in stages if row["stage"].startswith("llm.")]
+    return {
+        "path": parsed["path"],
+        "status": "ok",
+        "sha256": parsed["sha256"],
+        "pages": parsed["pages"],
+        "chunks": len(parsed["texts"]),
+        "parse_seconds": round(parsed["parse_seconds"], 3),
+        "analysis_seconds": round(time.perf_counter() - start, 3),
+        "tokens_in": sum(row.get("tokens_in", 0) for row in llm_rows),
+        "tokens_out": sum(row.get("tokens_out", 0) for row in llm_rows),
+        "screened_chunks": sum(row.get("screened", 0) for row in stages),
+        "requests_saved": sum(row.get("requests_saved", 0) for row in stages),
+        "prompt_tokens_saved": sum(row.get("prompt_tokens_saved", 0) for row in stages),
+        "summary": summary,
+        "risk_assessment": risk_assessment,
+    }
+
+
+def analyze_file(runner, path, single_pass=False, pack=None):
+    # Analyze one document with its pages read page-parallel and the map calls
+    # starting on the first chunks while later pages are still being read.
+    # Returns (final summary, risk assessment).
+    with open(path, "rb") as f:
+        data = f.read()
+    with trace("document", path=path):
+        chunks = iter_document_chunks(iter_pages(data, path))
+        return analyze_document(runner, (chunk.page_content for chunk in chunks), single_pass=single_pass, pack=pack)
+
+
+def run_batch(directory, out_path, runner, parse_workers=None, doc_workers=4, single_pass=False, pack=None,
+              log=print):
+    # Analyze every supported document under directory and append one JSON line
+    # per document to out_path. Documents already recorded as "ok" in out_path
+    # are skipped, so an interrupted run picks up where it stopped.
+    paths = find_documents(directory)
+    done = read_manifest(out_path)
+    todo = [path for path in paths if path not in done]
+    log(f"{len(paths)} documents found, {len(paths) - len(todo)} already in {out_path}, {len(todo)} to analyze")
+
+    parse_workers = parse_workers or os.cpu_count() or 1
+    # Parse a few documents ahead of the analysis, but not the whole directory
+    parse_window = parse_workers * 2
+    todo_iter = iter(todo)
+    usage_before = runner.usage()
+    start = time.perf_counter()
+    completed = 0
+    failed = 0
+
+    # Make sure a line cut short by an interrupted run doesn't swallow the next record
+    if os.path.exists(out_path) and os.path.getsize(out_path):
+        with open(out_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    with ProcessPoolExecutor(parse_workers) as parse_pool, \
+            ThreadPoolExecutor(doc_workers) as doc_pool, \
+            open(out_path, "a", encoding="utf-8") as out:
+        if needs_newline:
+            out.write("\n")
+
+        def write(record):
+            nonlocal completed, failed
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if record["status"] == "ok":
+                completed += 1
+                log(f"[{completed + failed}/{len(todo)}] {record['path']}: {record['chunks']} chunks "
+                    f"in {record['analysis_seconds']:.1f}s")
+            else:
+                failed += 1
+                log(f"[{completed + failed}/{len(todo)}] {record['path']}: {record['error']}")
+
+        parsing = {}
+        analyzing = {}
+        parsed_queue = deque()
+        while True:
+            while len(parsing) + len(parsed_queue) < parse_window:
+                path = next(todo_iter, None)
+                if path is None:
+                    break
+                parsing[parse_pool.submit(parse_document, path)] = path
+
+            while parsed_queue and len(analyzing) < doc_workers:
+                parsed = parsed_queue.popleft()
+                analyzing[doc_pool.submit(analyze_parsed, runner, parsed, single_pass, pack)] = parsed["path"]
+
+            if not parsing and not analyzing:
+                break
+
+            finished, _ = wait(list(parsing) + list(analyzing), return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in parsing:
+                    path = parsing.pop(future)
+                    try:
+                        parsed_queue.append(future.result())
+                    except Exception as e:
+                        write({"path": path, "status": "error", "stage": "parse", "error": str(e)})
+                else:
+                    path = analyzing.pop(future)
+                    try:
+                        write(future.result())
+                    except Exception as e:
+                        write({"path": path, "status": "error", "stage": "analysis", "error": str(e)})
+
+    elapsed = time.perf_counter() - start
+    usage = runner.usage()
+    calls = usage["calls"] - usage_before["calls"]
+    tokens = usage["tokens_in"] + usage["tokens_out"] - usage_before["tokens_in"] - usage_before["tokens_out"]
+    report = {
+        "documents": completed,
+        "failed": failed,
+        "seconds": round(elapsed, 1),
+        "documents_per_minute": round(completed / elapsed * 60, 2) if elapsed else 0.0,
+        "llm_calls": calls,
+        "cache_hits": usage["cache_hits"] - usage_before["cache_hits"],
+        "tokens_per_second": round(tokens / elapsed, 1) if elapsed else 0.0,
+    }
+    log(
+        f"{completed} documents analyzed, {failed} failed in {report['seconds']}s: "
+        f"{report['documents_per_minute']} documents/min, {report['tokens_per_second']} tokens/s, "
+        f"{calls} LLM calls, {report['cache_hits']} cache hits"
+    )
+    return report
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from legal_analyzer import config
+
+
+def make_key(model_name, template, inputs):
+    # Content address of a call: the same model, prompt and inputs always give
+    # the same answer key, no matter which user uploaded the document
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(template.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path, max_entries=None, max_bytes=None, max_age=None):
+        # max_age is in seconds, None disables the corresponding limit
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+            "created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model_name, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, len(response.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        if self.max_age is not None:
+            self.conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.max_age,))
+        if self.max_entries is not None:
+            # Drop the least recently used entries above the entry limit
+            self.conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed").fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size,
+            }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache():
+    # One cache per process, or None when LLM_CACHE_PATH is set to an empty value
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None and config.CACHE_PATH:
+            _shared_cache = LLMCache(
+                config.CACHE_PATH,
+                max_entries=config.CACHE_MAX_ENTRIES,
+                max_bytes=config.CACHE_MAX_BYTES,
+                max_age=config.CACHE_MAX_AGE_DAYS * 24 * 3600,
+            )
+        return _shared_cache
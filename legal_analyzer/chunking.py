@@ -0,0 +1,170 @@
+import math
+import re
+
+from langchain_core.documents import Document
+
+from legal_analyzer import config, prompts
+from legal_analyzer.ratelimit import estimate_tokens
+
+# Boundary strengths, a chunk preferably ends before a strong boundary
+CONTINUATION = 0
+CLAUSE = 1
+PAGE = 2
+SECTION = 3
+
+# How full a chunk has to be before we close it at a boundary of that strength
+# rather than keep packing
+BREAK_FILL = {SECTION: 0.5, PAGE: 0.75}
+
+# Headings that open an article, section, schedule, ...
+SECTION_PATTERN = re.compile(
+    r"^[ \t]*(?:ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|EXHIBIT|Exhibit|"
+    r"APPENDIX|Appendix|ANNEX|Annex|PART|Part)\b[ \t]*[\dIVXLC]+",
+    re.M,
+)
+# Numbered clauses such as "1.", "4.2", "12.3.1" or "(a)"
+CLAUSE_PATTERN = re.compile(r"^[ \t]*(?:\d+(?:\.\d+)*[.)]?|\([a-z0-9]{1,4}\))[ \t]+\S", re.M)
+
+# Fallbacks for text that doesn't fit a chunk: paragraphs, lines, sentences, words
+SPLIT_PATTERNS = [
+    re.compile(r"\n[ \t]*\n"),
+    re.compile(r"\n"),
+    re.compile(r"(?<=[.;:])\s+"),
+    re.compile(r"\s+"),
+]
+
+
+def chunk_token_budget(context_tokens=None):
+    # Largest chunk that fits the context next to the longest map prompt and the
+    # reserved answer tokens
+    if context_tokens is None:
+        context_tokens = config.CONTEXT_TOKENS
+    prompt_tokens = max(
+        estimate_tokens(prompts.CHUNK_SUMMARY_PROMPT),
+        estimate_tokens(prompts.CHUNK_RISK_PROMPT),
+        estimate_tokens(prompts.CHUNK_ANALYSIS_PROMPT),
+    )
+    return max(256, min(config.CHUNK_MAX_TOKENS, context_tokens - config.COMPLETION_TOKENS - prompt_tokens))
+
+
+def split_to_budget(text, max_tokens, level=0):
+    # Cut text that doesn't fit max_tokens at the coarsest possible boundary
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    if level == len(SPLIT_PATTERNS):
+        # The longest piece estimate_tokens still puts at max_tokens
+        size = max(1, max_tokens * 4 - 1)
+        return [text[i:i+size] for i in range(0, len(text), size)]
+
+    cuts = [m.end() for m in SPLIT_PATTERNS[level].finditer(text)]
+    pieces = []
+    # Segments are contiguous, so the pending piece is always text[current:start]
+    current = 0
+    for start, end in zip([0] + cuts, cuts + [len(text)]):
+        if end <= start:
+            continue
+        if current < start and estimate_tokens(text[current:end]) > max_tokens:
+            pieces.append(text[current:start])
+            current = start
+        if estimate_tokens(text[start:end]) > max_tokens:
+            pieces.extend(split_to_budget(text[start:end], max_tokens, level + 1))
+            current = end
+    if current < len(text):
+        pieces.append(text[current:])
+    return pieces
+
+
+def split_blocks(doc, max_tokens):
+    # Cut a loaded page into blocks that start at a heading or a numbered clause.
+    # Yields (text, metadata, strength, starts_page) tuples.
+    text = doc.page_content
+    starts = {0: PAGE}
+    for match in CLAUSE_PATTERN.finditer(text):
+        starts[match.start()] = max(starts.get(match.start(), CONTINUATION), CLAUSE)
+    for match in SECTION_PATTERN.finditer(text):
+        starts[match.start()] = SECTION
+
+    positions = sorted(starts)
+    for start, end in zip(positions, positions[1:] + [len(text)]):
+        pieces = split_to_budget(text[start:end], max_tokens)
+        for i, piece in enumerate(pieces):
+            if piece.strip():
+                yield piece, doc.metadata, starts[start] if i == 0 else CONTINUATION, start == 0 and i == 0
+
+
+def iter_chunks(docs, max_tokens=None):
+    # Pack the blocks of all pages into chunks of at most max_tokens, closing a
+    # chunk early at an article/section heading or a page break once it is
+    # reasonably full. There is no overlap between chunks. docs may be a
+    # stream of pages, every chunk is yielded as soon as it is complete.
+    if max_tokens is None:
+        max_tokens = chunk_token_budget()
+
+    parts = []
+    tokens = 0
+    first_meta = last_meta = None
+
+    def make_chunk():
+        content = "".join(parts).strip()
+        if not content:
+            return None
+        metadata = dict(first_meta)
+        if last_meta.get("page") != first_meta.get("page"):
+            metadata["last_page"] = last_meta.get("page")
+        return Document(page_content=content, metadata=metadata)
+
+    for doc in docs:
+        for text, metadata, strength, starts_page in split_blocks(doc, max_tokens):
+            block_tokens = estimate_tokens(text)
+            if parts:
+                full = tokens + block_tokens > max_tokens
+                early = strength in BREAK_FILL and tokens >= max_tokens * BREAK_FILL[strength]
+                if full or early:
+                    chunk = make_chunk()
+                    if chunk is not None:
+                        yield chunk
+                    parts = []
+                    tokens = 0
+            if not parts:
+                first_meta = metadata
+            elif starts_page:
+                parts.append("\n\n")
+            parts.append(text)
+            last_meta = metadata
+            tokens += block_tokens
+
+    if parts:
+        chunk = make_chunk()
+        if chunk is not None:
+            yield chunk
+
+
+def split_documents(docs, max_tokens=None):
+    return list(iter_chunks(docs, max_tokens))
+
+
+def estimate_fixed_chunks(docs, chunk_size=800, chunk_overlap=100):
+    # Approximate number of chunks the former CharacterTextSplitter(800, 100)
+    # setup produced for the same pages
+    total = 0
+    for doc in docs:
+        length = len(doc.page_content)
+        if length:
+            total += max(1, math.ceil((length - chunk_overlap) / (chunk_size - chunk_overlap)))
+    return total
+
+
+def chunk_stats(docs, chunks, chunk_size=800, chunk_overlap=100):
+    tokens = [estimate_tokens(chunk.page_content) for chunk in chunks]
+    fixed_chunks = estimate_fixed_chunks(docs, chunk_size, chunk_overlap)
+    text_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+    return {
+        "chunks": len(chunks),
+        "total_tokens": sum(tokens),
+        "mean_tokens": sum(tokens) // len(tokens) if tokens else 0,
+        "max_tokens": max(tokens, default=0),
+        "fixed_chunks": fixed_chunks,
+        "fixed_total_tokens": text_tokens + fixed_chunks * chunk_overlap // 4,
+        # Map-phase calls saved per pass over the chunks
+        "calls_saved": fixed_chunks - len(chunks),
+    }
@@ -0,0 +1,119 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Provider quotas used to pace LLM calls. The defaults match the Groq free
+# tier, set the variables in your .env file for paid plans.
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))
+
+# Number of LLM calls kept in flight at the same time
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# How often a call is retried after the provider answers with a 429
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+# Tokens reserved for the model's answer when estimating the cost of a call
+COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "512"))
+
+# Connections to the provider kept open and shared by all sessions, and how
+# long an idle connection is kept
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "120"))
+
+# Model used for every step of the analysis
+MODEL_NAME = os.getenv("LLM_MODEL", "mixtral-8x7b-32768")
+
+# "groq" calls the provider, "fake" runs a deterministic local model for tests
+# and benchmarks. The fake model's latency is in seconds per call.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "500"))
+FAKE_LLM_RATE_LIMIT_EVERY = int(os.getenv("FAKE_LLM_RATE_LIMIT_EVERY", "0"))
+
+# On-disk cache of LLM results, set LLM_CACHE_PATH to an empty value to disable it
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+
+# Context window of the models we use, in tokens
+MODEL_CONTEXT_TOKENS = {
+    "mixtral-8x7b-32768": 32768,
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "gemma2-9b-it": 8192,
+}
+CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "0")) or MODEL_CONTEXT_TOKENS.get(MODEL_NAME, 8192)
+
+# Upper bound for the size of a chunk. Chunks are sized to the context window,
+# but very large chunks make for shallow summaries and exhaust the per-minute
+# token quota with a single call.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "3000"))
+
+# Upper bound for the input of a reduce call (intermediate and final summaries,
+# risk register), and for the number of inputs combined in one intermediate
+# call. Inputs that don't fit one call are combined level by level.
+REDUCE_MAX_TOKENS = int(os.getenv("REDUCE_MAX_TOKENS", "4000"))
+REDUCE_MAX_FAN_IN = int(os.getenv("REDUCE_MAX_FAN_IN", "8"))
+
+# Uploaded PDFs of at least INGEST_PARALLEL_PAGES pages are read in batches of
+# INGEST_BATCH_PAGES pages across a pool of INGEST_WORKERS processes
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_PARALLEL_PAGES = int(os.getenv("INGEST_PARALLEL_PAGES", "16"))
+INGEST_BATCH_PAGES = int(os.getenv("INGEST_BATCH_PAGES", "8"))
+
+# Split documents are shared by all sessions, the most recently used ones up
+# to DOC_STORE_MAX_BYTES are kept after their sessions have ended
+DOC_STORE_MAX_BYTES = int(os.getenv("DOC_STORE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# Skip the LLM risk call for chunks a local keyword screen finds no
+# risk-bearing content in, such as signature blocks and tables of contents
+PRESCREEN_RISKS = os.getenv("PRESCREEN_RISKS", "true").lower() in ("1", "true", "yes")
+
+# Pack several small chunks into one map request, up to PACK_MAX_TOKENS of
+# chunk text and PACK_MAX_CHUNKS chunks, instead of repeating the prompt
+# instructions in a request per chunk
+PACK_CHUNKS = os.getenv("PACK_CHUNKS", "false").lower() in ("1", "true", "yes")
+PACK_MAX_TOKENS = int(os.getenv("PACK_MAX_TOKENS", "3000"))
+PACK_MAX_CHUNKS = int(os.getenv("PACK_MAX_CHUNKS", "6"))
+
+# Number of document excerpts retrieved as context for a QnA question
+QNA_TOP_K = int(os.getenv("QNA_TOP_K", "4"))
+
+# Upper bound for the context of a QnA question (excerpts, summary and risk
+# assessment), in tokens
+QNA_CONTEXT_TOKENS = int(os.getenv("QNA_CONTEXT_TOKENS", "6000"))
+
+# QnA answers are shared by all sessions asking about the same document, for
+# QNA_CACHE_TTL_SECONDS and up to QNA_CACHE_MAX_ENTRIES answers (0 disables the
+# cache). A question whose content words overlap a cached question's by at
+# least QNA_CACHE_SIMILARITY (Jaccard, 0 disables) gets the cached answer.
+QNA_CACHE_MAX_ENTRIES = int(os.getenv("QNA_CACHE_MAX_ENTRIES", "2048"))
+QNA_CACHE_TTL_SECONDS = float(os.getenv("QNA_CACHE_TTL_SECONDS", str(24 * 3600)))
+QNA_CACHE_SIMILARITY = float(os.getenv("QNA_CACHE_SIMILARITY", "0.8"))
+
+# Analyses run as background jobs in a pool of JOB_WORKERS threads. Jobs and
+# their checkpoints are kept in JOB_STORE_PATH (an empty value keeps them in
+# memory only) and finished jobs are deleted after JOB_MAX_AGE_DAYS.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", ".jobs.sqlite3")
+JOB_MAX_AGE_DAYS = float(os.getenv("JOB_MAX_AGE_DAYS", "7"))
+
+# The HTTP API (python -m legal_analyzer serve) runs API_WORKERS analyses at
+# the same time with up to API_MAX_QUEUE more waiting, further requests are
+# turned away with a 503 until the queue has room. Identical requests for the
+# same document share one analysis and don't take up room in the queue.
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+API_MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "32"))
+API_MAX_UPLOAD_BYTES = int(os.getenv("API_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+# TrueType font embedded in PDF reports with text outside Latin-1, by default
+# the DejaVu Sans shipped in legal_analyzer/fonts
+REPORT_FONT_PATH = os.getenv("REPORT_FONT_PATH", "")
+
+# JSON Lines file the spans of every analysis run are appended to, set
+# TRACE_LOG_PATH to an empty value to only log a one-line summary per run
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "traces.jsonl")
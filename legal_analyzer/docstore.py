@@ -0,0 +1,145 @@
+import hashlib
+import sys
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+
+from legal_analyzer import config
+
+
+def document_key(data, file_type, max_tokens):
+    # Identifies an upload and how it is split: the same file split with the
+    # same chunk budget gives the same chunks
+    digest = hashlib.sha256(data)
+    digest.update(f"\0{file_type}\0{max_tokens}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StoredDocument:
+    # The chunks of a split document in one text buffer. Chunk i is
+    # text[offsets[i]:offsets[i] + lengths[i]], from page pages[i] to
+    # last_pages[i] (-1 when the source has no pages). Reads like a list of
+    # chunk texts, each access slices the buffer. index is the document's
+    # search index once built (see retrieval.get_index), it lives as long as
+    # the document.
+    __slots__ = ("key", "text", "offsets", "lengths", "pages", "last_pages", "stats", "index", "__weakref__")
+
+    def __init__(self, key, chunks, stats=None):
+        self.key = key
+        self.offsets = array("q")
+        self.lengths = array("q")
+        self.pages = array("l")
+        self.last_pages = array("l")
+        # chunks may be a stream, every chunk is only read once
+        parts = []
+        offset = 0
+        for chunk in chunks:
+            page = chunk.metadata.get("page", -1)
+            self.offsets.append(offset)
+            self.lengths.append(len(chunk.page_content))
+            self.pages.append(page)
+            self.last_pages.append(chunk.metadata.get("last_page", page))
+            parts.append(chunk.page_content)
+            offset += len(chunk.page_content)
+        self.text = "".join(parts)
+        self.stats = stats
+        self.index = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        offset = self.offsets[i]
+        return self.text[offset:offset + self.lengths[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def nbytes(self):
+        # The chunks and, once built, the search index
+        arrays = (self.offsets, self.lengths, self.pages, self.last_pages)
+        nbytes = sys.getsizeof(self.text) + sum(len(values) * values.itemsize for values in arrays)
+        if self.index is not None:
+            nbytes += self.index.nbytes()
+        return nbytes
+
+
+class DocumentStore:
+    # Split documents shared by every session of the process, keyed by
+    # document_key. A session that uploads a file another session already
+    # uploaded gets the same StoredDocument, without reading the file again.
+    # The most recently used documents up to max_bytes, search indexes
+    # included, are kept after the sessions using them are gone, the others
+    # only as long as a session holds them.
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else config.DOC_STORE_MAX_BYTES
+        self.lock = threading.Lock()
+        self.recent = OrderedDict()
+        self.live = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            document = self.live.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._use(document)
+            return document
+
+    def put(self, key, chunks, stats=None):
+        # Store the chunks of a document, returns its StoredDocument. When the
+        # document is already stored the existing one is returned.
+        document = StoredDocument(key, chunks, stats)
+        with self.lock:
+            existing = self.live.get(key)
+            if existing is not None:
+                self._use(existing)
+                return existing
+            self.live[key] = document
+            self._use(document)
+            return document
+
+    def _use(self, document):
+        # Documents grow when their index is built, so their sizes are taken
+        # anew on every use
+        self.recent[document.key] = document
+        self.recent.move_to_end(document.key)
+        recent_bytes = self._recent_bytes()
+        while recent_bytes > self.max_bytes and len(self.recent) > 1:
+            _, evicted = self.recent.popitem(last=False)
+            recent_bytes -= evicted.nbytes()
+
+    def _recent_bytes(self):
+        return sum(document.nbytes() for document in self.recent.values())
+
+    def stats(self):
+        with self.lock:
+            documents = list(self.live.values())
+            return {
+                "documents": len(documents),
+                "bytes": sum(document.nbytes() for document in documents),
+                "recent_documents": len(self.recent),
+                "recent_bytes": self._recent_bytes(),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_shared_store = None
+_store_lock = threading.Lock()
+
+
+def get_document_store():
+    # One document store per process
+    global _shared_store
+    with _store_lock:
+        if _shared_store is None:
+            _shared_store = DocumentStore()
+        return _shared_store
@@ -0,0 +1,156 @@
+import csv
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+from legal_analyzer import config
+from legal_analyzer.chunking import iter_chunks
+
+# Formats by MIME type (as reported by Streamlit uploads) and by file extension
+FORMATS_BY_TYPE = {
+    "text/plain": "text",
+    "text/csv": "csv",
+    "application/pdf": "pdf",
+}
+FORMATS_BY_EXTENSION = {
+    ".txt": "text",
+    ".csv": "csv",
+    ".pdf": "pdf",
+}
+
+
+def get_format(name, file_type=None):
+    # "pdf", "text" or "csv", None if the file type is not supported. Type
+    # parameters such as "; charset=utf-8" are ignored, a type that names no
+    # format, e.g. application/octet-stream, falls back to the file extension.
+    if file_type:
+        file_format = FORMATS_BY_TYPE.get(file_type.split(";")[0].strip().lower())
+        if file_format is not None:
+            return file_format
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(name)[1].lower())
+
+
+def iter_text_pages(data, name):
+    yield Document(page_content=data.decode("utf-8", errors="replace"), metadata={"source": name})
+
+
+def iter_csv_pages(data, name):
+    # One document per row in the "column: value" layout of CSVLoader
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig", errors="replace")))
+    for row_number, row in enumerate(reader):
+        content = "\n".join(
+            f"{key.strip() if key is not None else key}: "
+            f"{','.join(value) if isinstance(value, list) else (value or '').strip()}"
+            for key, value in row.items()
+        )
+        yield Document(page_content=content, metadata={"source": name, "row": row_number})
+
+
+def pdf_page(reader, number, name):
+    # Page number of reader in the shape PyPDFLoader loads it
+    return Document(
+        page_content=reader.pages[number].extract_text().strip(),
+        metadata={"source": name, "total_pages": len(reader.pages), "page": number},
+    )
+
+
+# Reader of the PDF a worker process extracted pages from last, its batches
+# usually come from the same upload
+_worker_reader = (None, None)
+
+
+def extract_pdf_pages(path, start, end, name):
+    # Pages start to end of the PDF at path, runs in a worker process
+    global _worker_reader
+    from pypdf import PdfReader
+
+    reader_path, reader = _worker_reader
+    if reader_path != path:
+        reader = PdfReader(path)
+        _worker_reader = (path, reader)
+    return [pdf_page(reader, number, name) for number in range(start, end)]
+
+
+_page_pool = None
+_page_lock = threading.Lock()
+
+
+def get_page_pool():
+    # One pool of INGEST_WORKERS processes, shared by every upload. Workers are
+    # spawned rather than forked, forking the threaded server is not safe.
+    global _page_pool
+    with _page_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=config.INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _page_pool
+
+
+def iter_pdf_pages(data, name, workers=None):
+    # Pages of a PDF in memory. Long PDFs are extracted in batches across the
+    # page pool, the pages are yielded in order as soon as their batch is done.
+    # The workers read the PDF from a private temporary file that is removed
+    # once every page has been read.
+    from pypdf import PdfReader
+
+    if workers is None:
+        workers = config.INGEST_WORKERS
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    if workers <= 1 or total < config.INGEST_PARALLEL_PAGES:
+        for number in range(total):
+            yield pdf_page(reader, number, name)
+        return
+
+    batch_pages = max(1, min(config.INGEST_BATCH_PAGES, total // workers))
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    futures = []
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        pool = get_page_pool()
+        futures = [
+            pool.submit(extract_pdf_pages, path, start, min(start + batch_pages, total), name)
+            for start in range(0, total, batch_pages)
+        ]
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Stop the remaining batches when the reader gave up early
+        for future in futures:
+            future.cancel()
+        for future in futures:
+            if not future.cancelled():
+                future.exception()
+        os.remove(path)
+
+
+def iter_pages(data, name, file_type=None, workers=None):
+    # Pages of the file content data, read from memory. name is recorded as
+    # the pages' source and, without file_type, gives the format.
+    file_format = get_format(name, file_type)
+    if file_format is None:
+        raise ValueError(f"Unsupported file type: {file_type or name}")
+    if file_format == "pdf":
+        return iter_pdf_pages(data, name, workers=workers)
+    if file_format == "csv":
+        return iter_csv_pages(data, name)
+    return iter_text_pages(data, name)
+
+
+def iter_document_chunks(pages, on_page=None, max_tokens=None):
+    # Chunks of a stream of pages, yielded while later pages are still being
+    # read. on_page(page) is called for every page as it arrives.
+    def pages_seen():
+        for page in pages:
+            if on_page is not None:
+                on_page(page)
+            yield page
+
+    return iter_chunks(pages_seen(), max_tokens)
@@ -0,0 +1,342 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from legal_analyzer import config
+from legal_analyzer.pipeline import (
+    analyze_chunks, assess_chunks, chunks_key, reduce_risks, reduce_summaries, summarize_chunks,
+)
+from legal_analyzer.runner import get_shared_runner
+from legal_analyzer.tracing import trace
+
+ACTIVE = ("queued", "running")
+
+# Finished jobs kept in memory for their traces, older ones are only in the store
+MAX_FINISHED_IN_MEMORY = 100
+
+
+class JobStore:
+    # Jobs and their checkpointed chunk results in SQLite, so analyses survive
+    # a restart of the server. Params and results are stored as JSON.
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT, params TEXT, status TEXT, stage TEXT, "
+            "done INTEGER, total INTEGER, result TEXT, error TEXT, created REAL, updated REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_checkpoints ("
+            "job_id TEXT, step TEXT, chunk INTEGER, result TEXT, PRIMARY KEY (job_id, step, chunk))"
+        )
+        self.conn.commit()
+
+    def create(self, kind, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, stage, done, total, created, updated) "
+                "VALUES (?, ?, ?, 'queued', '', 0, 0, ?, ?)",
+                (job_id, kind, json.dumps(params), now, now),
+            )
+            self.conn.commit()
+        return job_id
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, kind, status, stage, done, total, result, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "stage": row[3],
+            "done": row[4],
+            "total": row[5],
+            "partial": "",
+            "result": json.loads(row[6]) if row[6] else None,
+            "error": row[7],
+        }
+
+    def unfinished(self):
+        # (id, kind, params) of the jobs that were queued or running when the
+        # process stopped
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, kind, params FROM jobs WHERE status IN (?, ?) ORDER BY created", ACTIVE
+            ).fetchall()
+        return [(job_id, kind, json.loads(params)) for job_id, kind, params in rows]
+
+    def save_checkpoints(self, job_id, step, indices, results):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO job_checkpoints (job_id, step, chunk, result) VALUES (?, ?, ?, ?)",
+                [(job_id, step, i, json.dumps(result)) for i, result in zip(indices, results)],
+            )
+            self.conn.commit()
+
+    def checkpoints(self, job_id, step):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT chunk, result FROM job_checkpoints WHERE job_id = ? AND step = ?", (job_id, step)
+            ).fetchall()
+        return {chunk: json.loads(result) for chunk, result in rows}
+
+    def prune(self, max_age):
+        # Drop finished jobs older than max_age seconds, and the checkpoints of
+        # every finished job
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated < ?", (*ACTIVE, time.time() - max_age)
+            )
+            self.conn.execute(
+                "DELETE FROM job_checkpoints WHERE job_id NOT IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?))", ACTIVE
+            )
+            self.conn.commit()
+
+
+class Job:
+    # Live state of a job run by this process. Progress and the partial answer
+    # are only kept in memory, the store gets them at checkpoints.
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.status = "queued"
+        self.stage = ""
+        self.done = 0
+        self.total = 0
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.trace = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "partial": self.partial,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobContext:
+    # What a job function uses to report progress and checkpoint chunk results
+    def __init__(self, store, job):
+        self.store = store
+        self.job = job
+
+    def stage(self, text):
+        self.job.stage = text
+        self.job.done = self.job.total = 0
+        self.store.update(self.job.id, stage=text, done=0, total=0)
+
+    def progress(self, done, total):
+        self.job.done = done
+        self.job.total = total
+
+    def map_chunks(self, step, func, texts, indices):
+        # Run func(texts, on_progress, on_result) -> results once over the
+        # chunks at indices, so all of them share its calls in flight. Results
+        # reported to on_result(position, result) are checkpointed every
+        # MAX_CONCURRENCY results and when func ends or fails. Chunks
+        # checkpointed by an earlier run of the job are not analyzed again.
+        # Returns {index: result}.
+        saved = self.store.checkpoints(self.job.id, step)
+        todo = [i for i in indices if i not in saved]
+        finished = len(indices) - len(todo)
+        pending = {}
+
+        def checkpoint():
+            nonlocal finished
+            if not pending:
+                return
+            self.store.save_checkpoints(self.job.id, step, list(pending), list(pending.values()))
+            saved.update(pending)
+            finished += len(pending)
+            pending.clear()
+            self.store.update(self.job.id, done=finished, total=len(indices))
+
+        def on_result(position, result):
+            pending[todo[position]] = result
+            if len(pending) >= max(1, config.MAX_CONCURRENCY):
+                checkpoint()
+
+        if todo:
+            start = finished
+            try:
+                results = func(
+                    [texts[i] for i in todo],
+                    lambda done, total: self.progress(start + done, len(indices)),
+                    on_result,
+                )
+                for i, result in zip(todo, results):
+                    if i not in saved:
+                        pending.setdefault(i, result)
+            finally:
+                checkpoint()
+        return {i: saved[i] for i in indices}
+
+    def stream(self, pieces):
+        # Collect a streamed answer, readers see it grow in the job's partial text
+        self.job.partial = ""
+        for piece in pieces:
+            self.job.partial += piece
+        return self.job.partial
+
+
+def job_chunk_results(ctx, runner, params, kind):
+    # Per-chunk "summaries" or "risks" of the job's chunks: the results the
+    # caller already had plus the missing ones, which are computed with
+    # checkpoints. Returns (results in chunk order, new results), new results
+    # hold [index, result] pairs of both kinds.
+    texts = params["texts"]
+    known = {i: result for i, result in params["chunk_results"].get(kind, [])}
+    missing = [i for i in range(len(texts)) if i not in known]
+    new = {"summaries": [], "risks": []}
+    pack = params.get("pack_chunks")
+    if missing:
+        ctx.stage("Analyzing document chunks...")
+        if params["single_pass"]:
+            def analyze(part, on_progress, on_result):
+                return list(zip(*analyze_chunks(runner, part, on_progress=on_progress, pack=pack, on_result=on_result)))
+
+            for i, (summary, risks) in ctx.map_chunks("analysis", analyze, texts, missing).items():
+                new["summaries"].append([i, summary])
+                new["risks"].append([i, risks])
+        elif kind == "summaries":
+            def analyze(part, on_progress, on_result):
+                return summarize_chunks(runner, part, on_progress=on_progress, pack=pack, on_result=on_result)
+
+            new["summaries"] = [list(item) for item in ctx.map_chunks("summaries", analyze, texts, missing).items()]
+        else:
+            def analyze(part, on_progress, on_result):
+                return assess_chunks(runner, part, on_progress=on_progress, pack=pack, on_result=on_result)
+
+            new["risks"] = [list(item) for item in ctx.map_chunks("risks", analyze, texts, missing).items()]
+    known.update(new[kind])
+    return [known[i] for i in range(len(texts))], new
+
+
+def summary_job(ctx, runner, params):
+    chunk_summaries, new = job_chunk_results(ctx, runner, params, "summaries")
+    memo = dict(params.get("memo", {}))
+    summary = ctx.stream(reduce_summaries(runner, chunk_summaries, stream=True, memo=memo, on_status=ctx.stage))
+    return {"text": summary, "chunks_key": chunks_key(params["texts"]), "chunk_results": new, "memo": memo}
+
+
+def risk_job(ctx, runner, params):
+    chunk_risks, new = job_chunk_results(ctx, runner, params, "risks")
+    ctx.stage("Creating final risk assessment report...")
+    report = ctx.stream(reduce_risks(runner, chunk_risks, on_status=ctx.stage, stream=True))
+    return {"text": report, "chunks_key": chunks_key(params["texts"]), "chunk_results": new}
+
+
+JOB_KINDS = {
+    "summary": summary_job,
+    "risk assessment": risk_job,
+}
+
+
+class JobManager:
+    # Runs analyses in a small thread pool, independent of the Streamlit
+    # session that submitted them. Jobs left unfinished by a previous process
+    # are resumed from their checkpoints.
+    def __init__(self, store, runner, max_workers=None):
+        self.store = store
+        self.runner = runner
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or config.JOB_WORKERS, thread_name_prefix="analysis-job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind, params):
+        # Start a job, returns its id
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.create(kind, params)
+        self.start(job_id, kind, params)
+        return job_id
+
+    def start(self, job_id, kind, params):
+        job = Job(job_id, kind)
+        with self.lock:
+            finished = [other for other, other_job in self.jobs.items() if other_job.status not in ACTIVE]
+            for other in finished[:-MAX_FINISHED_IN_MEMORY]:
+                del self.jobs[other]
+            self.jobs[job_id] = job
+        self.pool.submit(self.run, job, params)
+
+    def resume(self):
+        for job_id, kind, params in self.store.unfinished():
+            print(f"Resuming {kind} job {job_id}")
+            self.start(job_id, kind, params)
+
+    def status(self, job_id):
+        # Live state of a job of this process, otherwise what the store has
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.get(job_id)
+
+    def trace(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job.trace if job is not None else None
+
+    def run(self, job, params):
+        job.status = "running"
+        self.store.update(job.id, status="running")
+        try:
+            with trace(job.kind, job_id=job.id, chunks=len(params["texts"])) as run:
+                job.trace = run
+                result = JOB_KINDS[job.kind](JobContext(self.store, job), self.runner, params)
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}", e)
+            job.error = str(e)
+            job.status = "failed"
+            self.store.update(job.id, status="failed", error=job.error)
+            return
+        job.result = result
+        job.status = "done"
+        self.store.update(job.id, status="done", result=result)
+
+
+_job_manager = None
+_job_lock = threading.Lock()
+
+
+def get_job_manager():
+    # One job manager per process. The store is kept in memory when
+    # JOB_STORE_PATH is set to an empty value, jobs then don't survive restarts.
+    global _job_manager
+    with _job_lock:
+        if _job_manager is None:
+            store = JobStore(config.JOB_STORE_PATH or ":memory:")
+            store.prune(config.JOB_MAX_AGE_DAYS * 24 * 3600)
+            _job_manager = JobManager(store, get_shared_runner())
+            _job_manager.resume()
+        return _job_manager
@@ -0,0 +1,82 @@
+import contextvars
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from legal_analyzer import config
+from legal_analyzer.ratelimit import estimate_tokens, is_rate_limit_error, retry_after
+from legal_analyzer.tracing import add_to_current_span
+
+
+def estimate_request_tokens(inputs):
+    # Tokens a call is expected to use: the prompt variables plus room for the answer
+    prompt_tokens = sum(estimate_tokens(value) for value in inputs.values() if isinstance(value, str))
+    return prompt_tokens + config.COMPLETION_TOKENS
+
+
+def call_with_backoff(func, inputs, limiter=None, max_retries=None):
+    # Call func(inputs) within the quotas of limiter and retry only on 429s.
+    # Time spent waiting for the quotas and the retries are added to the
+    # current trace span.
+    if max_retries is None:
+        max_retries = config.MAX_RETRIES
+    tokens = estimate_request_tokens(inputs)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            add_to_current_span("queue_wait", limiter.acquire(tokens))
+        try:
+            return func(inputs)
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt >= max_retries:
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                delay = min(2 ** attempt, 30) * (1 + random.random() / 4)
+            print(f"Rate limited, retrying in {delay:.1f}s")
+            add_to_current_span("retries", 1)
+            add_to_current_span("queue_wait", delay)
+            if limiter is not None:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+
+def map_ordered(func, inputs_list, max_workers=None, on_progress=None, on_result=None):
+    # Run func over every inputs dict with several calls in flight and return
+    # the results in the order of inputs_list. on_progress(done, total) and
+    # on_result(index, result), as each call finishes, are called from the
+    # calling thread, so it is safe to update Streamlit widgets from them.
+    # Pacing and retries are up to func, see call_with_backoff. Every call runs
+    # in a copy of the calling thread's context, so it records its trace spans
+    # under the caller's current span. inputs_list may also be a stream, e.g.
+    # of chunks still being read: calls start as soon as their inputs arrive
+    # and total is only known once the stream ends.
+    if max_workers is None:
+        max_workers = config.MAX_CONCURRENCY
+    if isinstance(inputs_list, (list, tuple)):
+        if not inputs_list:
+            return []
+        max_workers = min(max_workers, len(inputs_list))
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {}
+    try:
+        for i, inputs in enumerate(inputs_list):
+            futures[pool.submit(contextvars.copy_context().run, func, inputs)] = i
+        total = len(futures)
+        results = [None] * total
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            results[i] = future.result()
+            if on_result is not None:
+                on_result(i, results[i])
+            if on_progress is not None:
+                on_progress(done, total)
+    except BaseException:
+        # Don't start the remaining calls once one of them has failed
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return results
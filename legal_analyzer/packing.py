@@ -0,0 +1,140 @@
+import re
+
+from legal_analyzer import config, prompts
+from legal_analyzer.ratelimit import estimate_tokens
+from legal_analyzer.tracing import add_to_current_span, span
+
+ANSWER_MARKER_PATTERN = re.compile(r"^[ \t]*=+[ \t]*ANSWER[ \t]+(\d+)[ \t]*=+[ \t]*$", re.M | re.I)
+
+
+def plan_packs(texts, max_tokens=None, max_chunks=None):
+    # Group the indices of texts into packs of consecutive chunks holding at
+    # most max_tokens of text and max_chunks chunks. A chunk larger than the
+    # budget gets a pack of its own.
+    if max_tokens is None:
+        max_tokens = config.PACK_MAX_TOKENS
+    if max_chunks is None:
+        max_chunks = config.PACK_MAX_CHUNKS
+    packs = []
+    pack = []
+    pack_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if pack and (pack_tokens + tokens > max_tokens or len(pack) >= max_chunks):
+            packs.append(pack)
+            pack = []
+            pack_tokens = 0
+        pack.append(i)
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def format_pack(texts):
+    # The chunks of a pack numbered from 1, each after its chunk marker
+    return "\n\n".join(
+        prompts.PACK_CHUNK_MARKER.format(number=number) + "\n" + text
+        for number, text in enumerate(texts, start=1)
+    )
+
+
+def split_packed_answer(answer, count):
+    # Answers of a packed request by chunk, None for the chunks the model gave
+    # no answer for. When a number comes up twice the first section counts.
+    answers = [None] * count
+    matches = list(ANSWER_MARKER_PATTERN.finditer(answer))
+    for position, match in enumerate(matches):
+        number = int(match.group(1))
+        if not 1 <= number <= count or answers[number - 1] is not None:
+            continue
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(answer)
+        answers[number - 1] = answer[match.end():end].strip() or None
+    return answers
+
+
+def map_packed(runner, template, texts, on_progress=None, valid=None, on_result=None):
+    # runner.map() of a chunk prompt with several chunks per request. Chunks
+    # with a cached answer are not sent again, the answers of packed requests
+    # are cached per chunk under the single-chunk prompt. Chunks whose answer
+    # is missing from the packed response, or fails valid(answer), are sent on
+    # their own. on_result(index, answer) is called for every chunk once its
+    # answer is known. The requests and prompt tokens saved compared to one
+    # request per chunk are added to the current span.
+    packed_template = prompts.PACKED_PROMPTS[template]
+    answers = [None] * len(texts)
+    keys = [None] * len(texts)
+    todo = []
+
+    def answered(i, answer):
+        answers[i] = answer
+        if on_result is not None:
+            on_result(i, answer)
+
+    for i, text in enumerate(texts):
+        keys[i], answer = runner.lookup(template, {"document": text})
+        if answer is None:
+            todo.append(i)
+        else:
+            answered(i, answer)
+    if len(todo) < len(texts):
+        add_to_current_span("cache_hits", len(texts) - len(todo))
+
+    packs = [[todo[j] for j in pack] for pack in plan_packs([texts[i] for i in todo])]
+    single = [pack[0] for pack in packs if len(pack) == 1]
+    packs = [pack for pack in packs if len(pack) > 1]
+    packed_chunks = sum(len(pack) for pack in packs)
+
+    with span("pack", chunks=packed_chunks, packs=len(packs)) as pack_span:
+        documents = [format_pack([texts[i] for i in pack]) for pack in packs]
+
+        def packed_progress(done, total):
+            if on_progress is not None:
+                on_progress(round(done / total * packed_chunks), len(todo))
+
+        unpacked = []
+
+        def unpack(number, result):
+            pack = packs[number]
+            for i, answer in zip(pack, split_packed_answer(result, len(pack))):
+                if answer is None or (valid is not None and not valid(answer)):
+                    unpacked.append(i)
+                    continue
+                if keys[i] is not None:
+                    runner.cache.put(keys[i], runner.model_name, answer)
+                answered(i, answer)
+
+        runner.map(
+            packed_template,
+            [{"document": document} for document in documents],
+            on_progress=packed_progress,
+            use_cache=False,
+            on_result=unpack,
+        )
+        pack_span.set("unpacked", len(unpacked))
+
+    if unpacked:
+        print(f"Could not use the packed answers of {len(unpacked)} chunks, sending them on their own")
+    single = sorted(single + unpacked)
+    if single:
+        done_before = len(todo) - len(single)
+
+        def single_progress(done, total):
+            if on_progress is not None:
+                on_progress(done_before + done, len(todo))
+
+        runner.map(
+            template,
+            [{"document": texts[i]} for i in single],
+            on_progress=single_progress,
+            on_result=lambda number, answer: answered(single[number], answer),
+        )
+
+    def prompt_tokens(prompt, document):
+        return estimate_tokens(prompt) + estimate_tokens(document)
+
+    sent_tokens = (sum(prompt_tokens(packed_template, document) for document in documents)
+                   + sum(prompt_tokens(template, texts[i]) for i in single))
+    add_to_current_span("requests_saved", len(todo) - len(packs) - len(single))
+    add_to_current_span("prompt_tokens_saved", sum(prompt_tokens(template, texts[i]) for i in todo) - sent_tokens)
+    return answers
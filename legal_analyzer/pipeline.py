@@ -0,0 +1,259 @@
+import hashlib
+
+from legal_analyzer import config, prompts
+from legal_analyzer.packing import map_packed
+from legal_analyzer.prescreen import screen_chunk
+from legal_analyzer.ratelimit import estimate_tokens
+from legal_analyzer.reduce import SEPARATOR, reduce_budget, tree_reduce
+from legal_analyzer.risks import (
+    SCREENED_PREFIX, collect_risks, format_risk_register, merge_risks, parse_risk_records, screened_chunks,
+)
+from legal_analyzer.tracing import add_to_current_span, span
+
+
+def chunks_key(texts):
+    # Identifies a split document, used to tell whether stored per-chunk
+    # results still belong to the chunks in the session
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def collect(texts, into):
+    # Pass a stream of chunk texts through, keeping them in the list into
+    for text in texts:
+        into.append(text)
+        yield text
+
+
+def map_chunks(runner, template, texts, on_progress=None, pack=None, valid=None, on_result=None):
+    # A chunk prompt over every text, with one request per chunk or, with
+    # pack set, several chunks per request (see map_packed). texts may be a
+    # stream of chunks still being read, without packing the first requests
+    # start before it ends. on_result(index, answer) is called as the answer
+    # of each chunk comes in.
+    if pack is None:
+        pack = config.PACK_CHUNKS
+    if pack:
+        return map_packed(runner, template, list(texts), on_progress=on_progress, valid=valid, on_result=on_result)
+    return runner.map(
+        template, ({"document": text} for text in texts), on_progress=on_progress, on_result=on_result
+    )
+
+
+def summarize_chunks(runner, texts, on_progress=None, pack=None, on_result=None):
+    with span("map.summaries") as map_span:
+        summaries = map_chunks(
+            runner, prompts.CHUNK_SUMMARY_PROMPT, texts, on_progress=on_progress, pack=pack, on_result=on_result
+        )
+        map_span.set("chunks", len(summaries))
+        return summaries
+
+
+def valid_risk_answer(answer):
+    return parse_risk_records(answer) is not None
+
+
+def assess_chunks(runner, texts, on_progress=None, prescreen=None, pack=None, on_result=None):
+    # With the local pre-screen, chunks without risk-bearing content are not
+    # sent to the model, their answer records why, and the other chunks are
+    # sent without their boilerplate lines. on_result(index, answer) is
+    # called for every chunk once its answer is known.
+    if prescreen is None:
+        prescreen = config.PRESCREEN_RISKS
+    with span("map.risks", chunks=len(texts)) as map_span:
+        answers = [None] * len(texts)
+        documents = {i: text for i, text in enumerate(texts)}
+        if prescreen:
+            with span("prescreen"):
+                screenings = [screen_chunk(text) for text in texts]
+            for i, screening in enumerate(screenings):
+                if screening.skip:
+                    answers[i] = SCREENED_PREFIX + screening.reason()
+                    del documents[i]
+                    if on_result is not None:
+                        on_result(i, answers[i])
+                elif screening.boilerplate_share:
+                    documents[i] = screening.content
+            map_span.set("screened", len(texts) - len(documents))
+            map_span.set("tokens_screened", sum(estimate_tokens(text) for text in texts)
+                         - sum(estimate_tokens(text) for text in documents.values()))
+
+        indices = list(documents)
+
+        def answered(number, answer):
+            answers[indices[number]] = answer
+            if on_result is not None:
+                on_result(indices[number], answer)
+
+        map_chunks(
+            runner,
+            prompts.CHUNK_RISK_PROMPT,
+            list(documents.values()),
+            on_progress=on_progress,
+            pack=pack,
+            valid=valid_risk_answer,
+            on_result=answered,
+        )
+        return answers
+
+
+def split_chunk_analysis(text):
+    # Split a combined analysis answer into (summary, risks), None if the model
+    # did not follow the format
+    summary_start = text.find(prompts.ANALYSIS_SUMMARY_MARKER)
+    risks_start = text.find(prompts.ANALYSIS_RISKS_MARKER)
+    if summary_start == -1 or risks_start == -1 or risks_start < summary_start:
+        return None
+    summary = text[summary_start + len(prompts.ANALYSIS_SUMMARY_MARKER):risks_start].strip()
+    risks = text[risks_start + len(prompts.ANALYSIS_RISKS_MARKER):].strip()
+    if not summary:
+        return None
+    return summary, risks
+
+
+def valid_analysis_answer(answer):
+    return split_chunk_analysis(answer) is not None
+
+
+def analyze_chunks(runner, texts, on_progress=None, pack=None, on_result=None):
+    # Summary and risks of every chunk with one call per chunk. Chunks whose
+    # answer can't be parsed are redone with the separate prompts. texts may
+    # be a stream of chunks. on_result(index, (summary, risks)) is called for
+    # every chunk once both are known.
+    def answered(i, answer):
+        parsed = split_chunk_analysis(answer)
+        if parsed is not None and on_result is not None:
+            on_result(i, parsed)
+
+    with span("map.analysis") as map_span:
+        seen = []
+        answers = map_chunks(
+            runner,
+            prompts.CHUNK_ANALYSIS_PROMPT,
+            collect(texts, seen),
+            on_progress=on_progress,
+            pack=pack,
+            valid=valid_analysis_answer,
+            on_result=answered,
+        )
+        texts = seen
+        map_span.set("chunks", len(texts))
+
+    chunk_summaries = []
+    chunk_risks = []
+    failed = []
+    for i, answer in enumerate(answers):
+        parsed = split_chunk_analysis(answer)
+        if parsed is None:
+            failed.append(i)
+            parsed = (None, None)
+        chunk_summaries.append(parsed[0])
+        chunk_risks.append(parsed[1])
+
+    if failed:
+        print(f"Could not parse the combined analysis of {len(failed)} chunks, using separate calls")
+        failed_texts = [texts[i] for i in failed]
+        failed_summaries = summarize_chunks(runner, failed_texts, pack=pack)
+        failed_risks = assess_chunks(runner, failed_texts, pack=pack)
+        for i, summary, risks in zip(failed, failed_summaries, failed_risks):
+            chunk_summaries[i] = summary
+            chunk_risks[i] = risks
+            if on_result is not None:
+                on_result(i, (summary, risks))
+
+    return chunk_summaries, chunk_risks
+
+
+def reduce_summaries(runner, chunk_summaries, stream=False, memo=None, on_status=None):
+    # Combine the chunk summaries into intermediate summaries, level by level,
+    # until they fit one final summary call (see tree_reduce). With stream=True
+    # the final summary is returned as a stream of text pieces. memo maps
+    # groups of summaries to intermediate summaries computed before, e.g. for
+    # the previous version of the document, and receives the new ones.
+    def status(text):
+        if on_status is not None:
+            on_status(text)
+
+    def summarize_node(node):
+        key = chunks_key(node)
+        if memo is not None and key in memo:
+            add_to_current_span("reused", 1)
+            return memo[key]
+        summary = runner.invoke(prompts.INTERMEDIATE_SUMMARY_PROMPT, {"document": SEPARATOR.join(node)})
+        if memo is not None:
+            memo[key] = summary
+        return summary
+
+    max_tokens = min(reduce_budget(prompts.INTERMEDIATE_SUMMARY_PROMPT), reduce_budget(prompts.FINAL_SUMMARY_PROMPT))
+    summaries = tree_reduce(
+        chunk_summaries,
+        summarize_node,
+        max_tokens,
+        name="reduce.summaries",
+        on_level=lambda level, nodes: status(f"Combining summaries, level {level} ({nodes} groups)..."),
+    )
+
+    status("Creating final summary...")
+    final_inputs = {"document": SEPARATOR.join(summaries)}
+    if stream:
+        return runner.stream(prompts.FINAL_SUMMARY_PROMPT, final_inputs)
+    with span("reduce.summaries.final", inputs=len(summaries)):
+        return runner.invoke(prompts.FINAL_SUMMARY_PROMPT, final_inputs)
+
+
+def reduce_risks(runner, chunk_risks, on_status=None, stream=False):
+    # The structured chunk findings are merged into a risk register in plain
+    # Python, the LLM only writes the mitigation part of the report. A register
+    # too long for the mitigation call is condensed for it with the same tree
+    # reduce as the summaries, the report keeps the full register. With
+    # stream=True the report is returned as a stream of text pieces.
+    def status(text):
+        if on_status is not None:
+            on_status(text)
+
+    status("Merging risk findings...")
+    with span("reduce.risks.merge", inputs=len(chunk_risks)) as merge_span:
+        records, unparsed = collect_risks(chunk_risks)
+        merged = merge_risks(records)
+        register = format_risk_register(merged, unparsed, screened_chunks(chunk_risks))
+        merge_span.set("findings", len(records))
+        merge_span.set("risks", len(merged))
+
+    def condense_node(node):
+        return runner.invoke(prompts.RISK_CONDENSE_PROMPT, {"document": SEPARATOR.join(node)})
+
+    max_tokens = min(reduce_budget(prompts.RISK_CONDENSE_PROMPT), reduce_budget(prompts.RISK_MITIGATION_PROMPT))
+    condensed = tree_reduce(
+        [register],
+        condense_node,
+        max_tokens,
+        name="reduce.risks",
+        on_level=lambda level, nodes: status(f"Condensing the risk register, level {level} ({nodes} parts)..."),
+    )
+
+    status("Creating final risk assessment report...")
+    final_inputs = {"document": SEPARATOR.join(condensed)}
+    if stream:
+        return stream_report(register, runner.stream(prompts.RISK_MITIGATION_PROMPT, final_inputs))
+    return register + "\n\n" + runner.invoke(prompts.RISK_MITIGATION_PROMPT, final_inputs)
+
+
+def stream_report(register, mitigation_pieces):
+    yield register + "\n\n"
+    yield from mitigation_pieces
+
+
+def analyze_document(runner, texts, single_pass=False, pack=None):
+    # Full analysis of a split document, returns (final summary, risk
+    # assessment). texts may be a stream of chunks still being read, the
+    # first map calls start with its first chunk.
+    if single_pass:
+        chunk_summaries, chunk_risks = analyze_chunks(runner, texts, pack=pack)
+    else:
+        seen = []
+        chunk_summaries = summarize_chunks(runner, collect(texts, seen), pack=pack)
+        chunk_risks = assess_chunks(runner, seen, pack=pack)
+    return reduce_summaries(runner, chunk_summaries), reduce_risks(runner, chunk_risks)
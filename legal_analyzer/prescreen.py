@@ -0,0 +1,137 @@
+import re
+from dataclasses import dataclass, field
+
+# Clause types that can carry legal risk. A chunk mentioning any of them is
+# always sent to the model.
+RISK_CLAUSE_PATTERNS = {
+    "Indemnification": r"\bindemnif\w*|\bhold\s+harmless\b",
+    "Liability": r"\bliab(?:le|ility|ilities)\b|\bdamages\b|\bconsequential\b",
+    "Termination": r"\bterminat\w*|\bexpir\w*|\brenew\w*",
+    "Governing Law": r"\bgoverning\s+law\b|\bgoverned\s+by\b|\bjurisdiction\b|\bvenue\b",
+    "Dispute Resolution": r"\barbitrat\w*|\bdisputes?\b|\bmediat\w*|\blitigation\b",
+    "Payment": r"\bpay(?:able|ment|ments)?\b|\binvoic\w*|\bfees?\b|\binterest\b|\bpenalt\w*",
+    "Confidentiality": r"\bconfidential\w*|\bnon-?disclosure\b",
+    "Data Protection": r"\bpersonal\s+data\b|\bdata\s+protection\b|\bGDPR\b|\bprivacy\b",
+    "Intellectual Property": r"\bintellectual\s+property\b|\blicen[cs]\w*|\bcopyright\w*|\bpatent\w*|\btrademark\w*",
+    "Warranty": r"\bwarrant\w*|\brepresentations?\b|\bguarant\w*",
+    "Assignment": r"\bassign\w*|\bchange\s+of\s+control\b|\bsubcontract\w*",
+    "Force Majeure": r"\bforce\s+majeure\b",
+    "Restrictive Covenants": r"\bnon-?compet\w*|\bnon-?solicit\w*|\bexclusiv\w*",
+    "Insurance": r"\binsurance\b|\binsured\b",
+    "Compliance": r"\bcomply\b|\bcompliance\b|\bbribery\b|\bsanctions?\b|\bexport\s+control\w*",
+    # Ambiguous or vague terms are a risk of their own, defined terms decide
+    # what the other clauses mean
+    "Definitions": r"\bshall\s+mean\b|\bshall\s+have\s+the\s+meaning\b|\bmeans\b|\bdefinitions?\b",
+}
+
+# Clause types that rarely carry risk on their own
+LOW_RISK_CLAUSE_PATTERNS = {
+    "Notices": r"\bnotices?\b",
+    "Counterparts": r"\bcounterparts?\b",
+    "Headings": r"\bheadings?\b",
+}
+
+# Obligation, permission and ownership language. A chunk that uses any of it
+# but matches none of the clause types is still sent to the model.
+OBLIGATION_PATTERN = re.compile(
+    r"\bshall\b(?!\s+(?:mean|have\s+the\s+meaning|include))|\bmust\b|\bwill\b|\bmay\b|\bshould\b|"
+    r"\bagrees?\s+to\b|\bundertakes?\b|\bis\s+responsible\b|"
+    r"\b(?:is|are)\s+(?:required|obliged|obligated|entitled|permitted|prohibited|not\s+allowed)\b|"
+    r"\bowned\s+by\b|\bown(?:s|ership)\b|\bvests?\b|\bbelongs?\s+to\b|\bremains?\s+the\s+property\b",
+    re.I,
+)
+
+# Lines of signature blocks, notice addresses, tables of contents and page
+# headers or footers
+BOILERPLATE_LINE_PATTERNS = [
+    r"^\s*(?:by|name|title|date|signature|signed|witness|its)\s*:",
+    r"^\s*_{3,}",
+    r"^\s*(?:attn|attention|address|tel|telephone|phone|fax|e-?mail|with\s+a\s+copy\s+to)\s*[:.]",
+    # "221B Baker Street, London NW1 6XE": a house number, at most four words
+    # up to the street type and a short rest with no sentence in it, so a
+    # numbered clause that mentions a floor or a road is kept
+    r"^(?!.*\b(?:shall|must|will|may|agrees?|is|are)\b)\s*\d+[a-z]?\s+(?:[\w.'-]+\s+){0,4}"
+    r"(?:street|st|avenue|ave|road|rd|boulevard|blvd|lane|drive|suite|floor)\b\.?[\w .,'#/-]{0,60}$",
+    r"^\s*table\s+of\s+contents\s*$",
+    r"\.{4,}\s*\d+\s*$",
+    r"^\s*page\s+\d+(?:\s+of\s+\d+)?\s*$",
+    r"^\s*-?\s*\d+\s*-?\s*$",
+    r"^\s*(?:confidential|draft|execution\s+(?:version|copy))\s*$",
+]
+
+# Stock sentences that are boilerplate wherever they appear. Only matched in
+# lines of up to FINGERPRINT_MAX_LINE characters, a longer line is likely a
+# whole paragraph with more in it.
+FINGERPRINT_MAX_LINE = 300
+BOILERPLATE_FINGERPRINTS = [
+    "in witness whereof",
+    "executed in any number of counterparts",
+    "executed in counterparts",
+    "headings are for convenience only",
+    "signature page follows",
+    "intentionally left blank",
+    "have caused this agreement to be executed",
+    "duly authorized representatives",
+]
+
+RISK_CLAUSES = {name: re.compile(pattern, re.I) for name, pattern in RISK_CLAUSE_PATTERNS.items()}
+LOW_RISK_CLAUSES = {name: re.compile(pattern, re.I) for name, pattern in LOW_RISK_CLAUSE_PATTERNS.items()}
+BOILERPLATE_LINES = [re.compile(pattern, re.I) for pattern in BOILERPLATE_LINE_PATTERNS]
+
+
+@dataclass
+class Screening:
+    # Local classification of a chunk. skip is set when the chunk has no
+    # risk-bearing content and does not need to go to the model, content is the
+    # chunk without its boilerplate lines.
+    content: str = ""
+    clause_types: list = field(default_factory=list)
+    boilerplate_share: float = 0.0
+    obligations: bool = False
+    skip: bool = False
+
+    def reason(self):
+        if self.clause_types:
+            return ", ".join(self.clause_types)
+        if self.boilerplate_share:
+            return f"{self.boilerplate_share:.0%} boilerplate"
+        return "no obligations"
+
+
+def is_boilerplate(line):
+    if len(line) <= FINGERPRINT_MAX_LINE:
+        lowered = line.lower()
+        if any(fingerprint in lowered for fingerprint in BOILERPLATE_FINGERPRINTS):
+            return True
+    return any(pattern.search(line) for pattern in BOILERPLATE_LINES)
+
+
+def screen_chunk(text):
+    # Classify a chunk with regular expressions only. A chunk is skipped when
+    # what is left after removing boilerplate lines matches none of the risk
+    # clause types and has no obligation, permission or ownership language. A
+    # low-risk clause type such as notices only names the chunk, a word like
+    # "notice" in a delivery obligation must not have it skipped.
+    content = []
+    boilerplate_chars = 0
+    total_chars = 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        total_chars += len(line)
+        if is_boilerplate(line):
+            boilerplate_chars += len(line)
+        else:
+            content.append(line)
+    content = "\n".join(content)
+
+    risk_types = [name for name, pattern in RISK_CLAUSES.items() if pattern.search(content)]
+    low_risk_types = [name for name, pattern in LOW_RISK_CLAUSES.items() if pattern.search(content)]
+    obligations = bool(OBLIGATION_PATTERN.search(content))
+    return Screening(
+        content=content,
+        clause_types=risk_types or low_risk_types,
+        boilerplate_share=boilerplate_chars / total_chars if total_chars else 1.0,
+        obligations=obligations,
+        skip=not risk_types and not obligations,
+    )
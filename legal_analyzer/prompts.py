@@ -0,0 +1,147 @@
+# Prompt templates used by the analysis pipeline. The template text is part of
+# the LLM cache key, so editing a prompt automatically invalidates its cached
+# results.
+
+CHUNK_SUMMARY_PROMPT = (
+    "You are a highly skilled legal expert tasked with summarizing legal text. "
+    "Please summarize the following chunk of legal text in a concise manner, "
+    "highlighting the most critical information. Focus on key clauses, obligations, "
+    "rights, and definitions. Do not omit any key details:\n\n{document}"
+)
+
+INTERMEDIATE_SUMMARY_PROMPT = (
+    "You are a senior legal expert tasked with creating a concise summary from these "
+    "document summaries. Combine these summaries into a cohesive and "
+    "comprehensive summary:\n\n{document}"
+)
+
+FINAL_SUMMARY_PROMPT = (
+    "You are a senior legal expert tasked with creating a final summary from summarized chunks "
+    "of a legal document. Combine the key points from the provided summaries into a cohesive and "
+    "comprehensive summary. The final summary should be organized by key sections (e.g., Parties, "
+    "Definitions, Obligations, Rights, Term & Termination, etc.) and be detailed enough to capture "
+    "the main legal implications:\n\n{document}"
+)
+
+# Risk categories the chunk prompts ask the model to choose from
+RISK_CATEGORIES = [
+    "Ambiguity",
+    "Compliance",
+    "Contradiction",
+    "Missing Terms",
+    "Indemnification",
+    "Liability",
+    "Termination",
+    "Other",
+]
+
+# Per-chunk risks come back as structured records, so they can be merged
+# without further LLM calls
+RISK_RECORD_FORMAT = (
+    "a JSON array containing one object per risk, with the keys "
+    "\"clause\" (the clause or section reference), "
+    "\"category\" (one of: " + ", ".join(RISK_CATEGORIES) + "), "
+    "\"severity\" (Low, Medium or High) and \"explanation\" (the issue in one or two sentences). "
+    "Use an empty array [] if the text contains no risks."
+)
+
+CHUNK_RISK_PROMPT = (
+    "You are a legal risk assessment expert. Review the following chunk of legal text "
+    "and identify potential legal risks, including but not limited to:\n"
+    "1. Ambiguous or vague terms\n"
+    "2. Compliance gaps or regulatory issues\n"
+    "3. Contradictory clauses\n"
+    "4. Missing essential terms\n"
+    "5. Unfavorable indemnification clauses\n"
+    "6. Liability exposures\n"
+    "7. Termination vulnerabilities\n\n"
+    "For each identified risk, specify the clause or section, explain the issue, "
+    "and provide a severity assessment (Low, Medium, High).\n\n"
+    "Answer only with " + RISK_RECORD_FORMAT + "\n\n"
+    "TEXT TO ANALYZE:\n{document}"
+)
+
+# Only used when the risk register is too long for the mitigation prompt,
+# parts of it are condensed until it fits
+RISK_CONDENSE_PROMPT = (
+    "You are a legal risk assessment expert. Below is part of the consolidated register of the risks "
+    "identified in a legal document. Condense it into a shorter register: keep every High severity risk "
+    "with its clause or section reference, and combine related Medium and Low risks into single entries. "
+    "Keep the category headings and the bullet format.\n\n"
+    "RISK REGISTER:\n{document}"
+)
+
+# The risk register is merged in Python, the model only writes the narrative
+# part of the report
+RISK_MITIGATION_PROMPT = (
+    "You are a legal risk assessment expert. Below is the consolidated register of the risks "
+    "identified in a legal document, grouped by category and sorted by severity. "
+    "Write the closing sections of the risk report:\n"
+    "1. Specific mitigation recommendations, starting with the most severe risks\n"
+    "2. A summary risk profile (Low, Medium, or High) for the overall document, with a short justification\n\n"
+    "Use clear headings and bullet points. Do not repeat the register itself.\n\n"
+    "RISK REGISTER:\n{document}"
+)
+
+CHAT_PROMPT = (
+    "You are a legal assistant answering questions about a legal document. "
+    "Use the following excerpts of the document, and its summary and risk assessment when given, "
+    "as context to answer the question with a cautious, precise legal perspective.\n\n"
+    "CONTEXT: {context}\n\n"
+    "QUESTION: {question}\n\n"
+    "If the answer isn't clearly in the context, acknowledge that limitation and provide "
+    "general legal information with appropriate disclaimers. Avoid making definitive "
+    "legal conclusions without sufficient information."
+)
+
+# Single-pass analysis of a chunk: the summary and the risk findings come back
+# in one answer, split on the section markers below
+ANALYSIS_SUMMARY_MARKER = "### SUMMARY"
+ANALYSIS_RISKS_MARKER = "### RISKS"
+
+CHUNK_ANALYSIS_PROMPT = (
+    "You are a legal expert reviewing a chunk of a legal document. Produce two sections.\n\n"
+    "In the first section, summarize the chunk in a concise manner, highlighting the most "
+    "critical information. Focus on key clauses, obligations, rights, and definitions. "
+    "Do not omit any key details.\n\n"
+    "In the second section, identify potential legal risks, including but not limited to:\n"
+    "1. Ambiguous or vague terms\n"
+    "2. Compliance gaps or regulatory issues\n"
+    "3. Contradictory clauses\n"
+    "4. Missing essential terms\n"
+    "5. Unfavorable indemnification clauses\n"
+    "6. Liability exposures\n"
+    "7. Termination vulnerabilities\n"
+    "For each identified risk, specify the clause or section, explain the issue, "
+    "and provide a severity assessment (Low, Medium, High). "
+    "Give the risks as " + RISK_RECORD_FORMAT + "\n\n"
+    "Answer in exactly this format:\n"
+    + ANALYSIS_SUMMARY_MARKER + "\n<summary>\n"
+    + ANALYSIS_RISKS_MARKER + "\n<JSON array of risks>\n\n"
+    "TEXT TO ANALYZE:\n{document}"
+)
+
+# Several chunks packed into one request: every chunk starts with a chunk
+# marker and every answer section with an answer marker, both carrying the
+# number of the chunk. The packed prompts put these instructions in front of
+# the single-chunk prompts, so editing a chunk prompt changes both.
+PACK_CHUNK_MARKER = "=== CHUNK {number} ==="
+PACK_ANSWER_MARKER = "=== ANSWER {number} ==="
+
+PACKING_INSTRUCTIONS = (
+    "The text to analyze below holds several separate chunks of a legal document, each starting "
+    "with a line \"=== CHUNK <n> ===\". Follow the instructions below for every chunk on its own. "
+    "Answer with one section per chunk, in chunk order: a line \"=== ANSWER <n> ===\" with the "
+    "number of the chunk, followed by the answer for that chunk alone in the format asked for. "
+    "Do not write anything outside these sections.\n\n"
+)
+
+PACKED_CHUNK_SUMMARY_PROMPT = PACKING_INSTRUCTIONS + CHUNK_SUMMARY_PROMPT
+PACKED_CHUNK_RISK_PROMPT = PACKING_INSTRUCTIONS + CHUNK_RISK_PROMPT
+PACKED_CHUNK_ANALYSIS_PROMPT = PACKING_INSTRUCTIONS + CHUNK_ANALYSIS_PROMPT
+
+PACKED_PROMPTS = {
+    CHUNK_SUMMARY_PROMPT: PACKED_CHUNK_SUMMARY_PROMPT,
+    CHUNK_RISK_PROMPT: PACKED_CHUNK_RISK_PROMPT,
+    CHUNK_ANALYSIS_PROMPT: PACKED_CHUNK_ANALYSIS_PROMPT,
+}
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from legal_analyzer import config
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_rate):
+        # refill_rate is in units per second
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        # Take amount out of the bucket and return how many seconds the caller
+        # has to wait before using it. The level may go negative, which queues
+        # later callers behind earlier ones.
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_rate)
+            self.updated = now
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_rate
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        # Block until one request and the estimated tokens fit the quotas,
+        # returns the seconds waited
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self.lock:
+            wait = max(wait, self.resume_at - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0.0
+
+    def pause(self, seconds):
+        # Hold back every caller, used when the provider answers with a 429
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_limiter():
+    # The quotas belong to the API key, so every session of the process has to
+    # draw from the same limiter
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(config.REQUESTS_PER_MINUTE, config.TOKENS_PER_MINUTE)
+        return _shared_limiter
+
+
+def estimate_tokens(text):
+    # Rough estimate of about four characters per token
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429
+
+
+def retry_after(exc):
+    # Seconds the provider asked us to wait, or None if it did not say
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,99 @@
+import hashlib
+
+from legal_analyzer import config
+from legal_analyzer.chunking import split_to_budget
+from legal_analyzer.mapper import map_ordered
+from legal_analyzer.ratelimit import estimate_tokens
+from legal_analyzer.tracing import span
+
+# Separator of the inputs combined into one reduce prompt
+SEPARATOR = "\n\n"
+
+
+def reduce_budget(template):
+    # Tokens of input a reduce call with template can take: REDUCE_MAX_TOKENS,
+    # or less when the context window or the per-minute token quota can't
+    # hold that next to the prompt and the reserved answer tokens
+    reserved = config.COMPLETION_TOKENS + estimate_tokens(template)
+    return max(
+        2 * config.COMPLETION_TOKENS,
+        min(config.REDUCE_MAX_TOKENS, config.CONTEXT_TOKENS - reserved, config.TOKENS_PER_MINUTE - reserved),
+    )
+
+
+def combined_tokens(texts):
+    return sum(estimate_tokens(text) for text in texts) + estimate_tokens(SEPARATOR) * max(0, len(texts) - 1)
+
+
+def fan_in(texts, max_tokens):
+    # Inputs per node: as many of the average input as fit max_tokens, at
+    # least 2 and at most REDUCE_MAX_FAN_IN
+    average = combined_tokens(texts) / len(texts) if texts else 1
+    return max(2, min(config.REDUCE_MAX_FAN_IN, int(max_tokens // max(average, 1))))
+
+
+def split_evenly(text, max_tokens):
+    # text in pieces of at most max_tokens and about the same size, so the
+    # pieces of a long text can share nodes with each other
+    count = -(-estimate_tokens(text) // max_tokens)
+    if count <= 1:
+        return [text]
+    return split_to_budget(text, -(-estimate_tokens(text) // count))
+
+
+def plan_nodes(texts, max_tokens, size):
+    # Group texts into nodes of about size texts, none over max_tokens. Small
+    # nodes end at size. From a size of 8 on, a node ends after a text whose
+    # hash is a multiple of a third of the window of a quarter around size,
+    # so nodes still hold about size texts on average but a revised document
+    # only changes the nodes around its edits, where fixed groups would all
+    # shift after an added or removed text.
+    spread = size // 4 if size >= 8 else 0
+    nodes = [[]]
+    tokens = 0
+    for text in texts:
+        text_tokens = estimate_tokens(text) + estimate_tokens(SEPARATOR)
+        if nodes[-1] and tokens + text_tokens > max_tokens:
+            nodes.append([])
+            tokens = 0
+        nodes[-1].append(text)
+        tokens += text_tokens
+        count = len(nodes[-1])
+        if spread and count >= size - spread:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            cut = int.from_bytes(digest[:4], "big") % (spread + 1) == 0
+        else:
+            cut = False
+        if cut or count >= size + spread:
+            nodes.append([])
+            tokens = 0
+    return [node for node in nodes if node]
+
+
+def tree_reduce(texts, reduce_node, max_tokens, name="reduce", on_level=None):
+    # Reduce texts level by level until they fit max_tokens together, and
+    # return what is left for the final call. Every level groups the texts
+    # into nodes of a fan-in picked from their size (see plan_nodes) and runs
+    # reduce_node(node texts) -> text for all nodes of the level concurrently,
+    # so the calls in sequence grow with the depth of the tree, the log of the
+    # number of texts. The texts of every level are split to half of
+    # max_tokens first, so any two of them fit one node, also when the
+    # outputs of the level before are long. Levels go on until the texts fit,
+    # unless the outputs of a level are no shorter than its inputs.
+    # on_level(level, nodes) is called before each level.
+    piece_tokens = (max_tokens - estimate_tokens(SEPARATOR)) // 2
+    level = 0
+    while combined_tokens(texts) > max_tokens:
+        tokens = combined_tokens(texts)
+        texts = [piece for text in texts for piece in split_evenly(text, piece_tokens)]
+        level += 1
+        nodes = plan_nodes(texts, max_tokens, fan_in(texts, max_tokens))
+        if on_level is not None:
+            on_level(level, len(nodes))
+        with span(f"{name}.level", level=level, inputs=len(texts), nodes=len(nodes)):
+            texts = map_ordered(reduce_node, nodes)
+        if combined_tokens(texts) >= tokens:
+            # The outputs are as long as their inputs, more levels won't help
+            print(f"{name} level {level} did not shorten its inputs, stopping")
+            break
+    return texts
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import fpdf
+from fpdf import FPDF
+
+from legal_analyzer import config
+from legal_analyzer.tracing import trace
+
+# Number of rendered PDFs kept in memory, shared by every session
+MAX_RENDERED_REPORTS = 64
+
+# TrueType font shipped with the package for reports with text outside
+# Latin-1, see fonts/LICENSE
+UNICODE_FONT_PATH = os.path.join(os.path.dirname(__file__), "fonts", "DejaVuSans.ttf")
+
+# The metrics of embedded fonts are parsed on every render rather than
+# cached next to the font file, which is usually not writable
+fpdf.set_global("FPDF_CACHE_MODE", 1)
+
+_rendered = OrderedDict()
+_rendered_lock = threading.Lock()
+
+
+def unicode_font_path():
+    # The configured TrueType font, else the one shipped with the package
+    path = config.REPORT_FONT_PATH or UNICODE_FONT_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Report font {path} not found, set REPORT_FONT_PATH to a TrueType font")
+    return path
+
+
+def bold_variant(path):
+    # "DejaVuSans.ttf" -> "DejaVuSans-Bold.ttf" if that exists, else path
+    root, extension = os.path.splitext(path)
+    bold = root + "-Bold" + extension
+    return bold if os.path.exists(bold) else path
+
+
+def is_latin1(text):
+    try:
+        text.encode("latin-1")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def render_pdf(sections):
+    # PDF of sections, a list of (title, text) pairs, one page per section.
+    # Text that Latin-1 can't hold is written with an embedded Unicode font,
+    # Latin-1 text with the built-in Arial, which needs no embedding.
+    pdf = FPDF()
+    if all(is_latin1(title) and is_latin1(text) for title, text in sections):
+        family = "Arial"
+    else:
+        font_path = unicode_font_path()
+        pdf.add_font("Report", "", font_path, uni=True)
+        pdf.add_font("Report", "B", bold_variant(font_path), uni=True)
+        family = "Report"
+
+    for title, text in sections:
+        pdf.add_page()
+        pdf.set_font(family, "B", 16)
+        pdf.cell(0, 10, title, ln=True, align="C")
+        pdf.ln(10)
+
+        pdf.set_font(family, size=12)
+        for line in text.split("\n"):
+            pdf.multi_cell(0, 10, txt=line)
+
+    # fpdf 1.7 appends every character it writes to the font subset and scans
+    # that list once per glyph of the font when writing it out, which makes
+    # long reports take minutes. The subset only needs each character once.
+    for font in pdf.fonts.values():
+        if font.get("subset"):
+            font["subset"] = list(dict.fromkeys(font["subset"]))
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def report_key(sections):
+    digest = hashlib.sha256()
+    for title, text in sections:
+        for value in (title, text):
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def report_pdf(sections, name="report"):
+    # render_pdf() memoized by content, a report is rendered once per process
+    # however often it is downloaded. Every render is traced as "render_pdf".
+    key = report_key(sections)
+    with _rendered_lock:
+        if key in _rendered:
+            _rendered.move_to_end(key)
+            return _rendered[key]
+
+    with trace("render_pdf", report=name, chars=sum(len(text) for _, text in sections)):
+        data = render_pdf(sections)
+
+    with _rendered_lock:
+        _rendered[key] = data
+        while len(_rendered) > MAX_RENDERED_REPORTS:
+            _rendered.popitem(last=False)
+    return data
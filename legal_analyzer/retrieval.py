@@ -0,0 +1,172 @@
+import math
+import re
+import sys
+import threading
+import weakref
+from collections import Counter, OrderedDict, defaultdict
+
+from legal_analyzer import config, prompts
+from legal_analyzer.chunking import split_to_budget
+from legal_analyzer.docstore import StoredDocument
+from legal_analyzer.pipeline import chunks_key
+from legal_analyzer.ratelimit import estimate_tokens
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this "
+    "to was were will with shall which what who whom when where how does do any such".split()
+)
+
+# Number of indexes of plain lists of chunks kept in memory, the index of a
+# StoredDocument is kept with the document
+MAX_INDEXES = 32
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    # Okapi BM25 over the chunks of one document. Chunks can be added one at a
+    # time, so the index can be built while the document is still being split.
+    # Given texts, e.g. a StoredDocument, the index is built over them and
+    # reads the excerpts back from there instead of keeping its own copy.
+    def __init__(self, k1=1.5, b=0.75, texts=None):
+        self.k1 = k1
+        self.b = b
+        self.texts = []
+        self.lengths = []
+        # term -> [(chunk index, term frequency), ...]
+        self.postings = defaultdict(list)
+        self.total_length = 0
+        self._nbytes = None
+        if texts is not None:
+            for i, text in enumerate(texts):
+                self.index(i, text)
+            self.texts = texts
+            # Indexes over given texts don't grow, their size is taken once
+            self._nbytes = self._count_bytes()
+
+    def add(self, text):
+        self.index(len(self.texts), text)
+        self.texts.append(text)
+
+    def index(self, i, text):
+        tokens = tokenize(text)
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings[term].append((i, tf))
+
+    def search(self, query, k=4):
+        # Return the (index, score) pairs of the k best chunks for query
+        if not self.texts:
+            return []
+        count = len(self.texts)
+        avg_length = self.total_length / count or 1
+        scores = Counter()
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def nbytes(self):
+        # Memory of the postings and chunk lengths, the texts are not the index's
+        if self._nbytes is not None:
+            return self._nbytes
+        return self._count_bytes()
+
+    def _count_bytes(self):
+        nbytes = sys.getsizeof(self.postings) + sys.getsizeof(self.lengths)
+        for term, postings in self.postings.items():
+            nbytes += sys.getsizeof(term) + sys.getsizeof(postings)
+            nbytes += sum(sys.getsizeof(posting) for posting in postings)
+        return nbytes
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(texts, key=None):
+    # Index of a split document, built once per process for each document and
+    # shared by every session that uploads the same content. A StoredDocument
+    # keeps its index, which reads the chunks through a weak proxy of it, so
+    # the index is freed with the document and counts in its nbytes(). For a
+    # plain list of chunks key identifies the document, by default the hash
+    # of its chunks, and the MAX_INDEXES most recent indexes are kept.
+    if isinstance(texts, StoredDocument):
+        if texts.index is None:
+            index = BM25Index(texts=weakref.proxy(texts))
+            with _indexes_lock:
+                if texts.index is None:
+                    texts.index = index
+        return texts.index
+
+    if key is None:
+        key = chunks_key(texts)
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    index = BM25Index(texts=texts)
+
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def qna_context_budget(context_tokens=None):
+    # Tokens available for the context of a question: QNA_CONTEXT_TOKENS, or
+    # less when the model's context window can't hold that next to the prompt
+    # and the reserved answer tokens
+    if context_tokens is None:
+        context_tokens = config.CONTEXT_TOKENS
+    prompt_tokens = estimate_tokens(prompts.CHAT_PROMPT)
+    return max(256, min(config.QNA_CONTEXT_TOKENS, context_tokens - config.COMPLETION_TOKENS - prompt_tokens))
+
+
+def trim_to_tokens(text, max_tokens):
+    # The start of text up to max_tokens, cut at the coarsest boundary that fits
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return split_to_budget(text, max_tokens)[0].rstrip() + "\n[...]"
+
+
+def build_context(index, question, summary="", risk_assessment="", k=4, max_tokens=None):
+    # Context for a question: the most relevant excerpts of the document plus
+    # the summary and risk assessment when they have been generated, within
+    # max_tokens (by default qna_context_budget()). The summary and the risk
+    # assessment get at most a quarter of the budget each, so they can't crowd
+    # out the excerpts however long they grow. The excerpts fill the rest in
+    # order of relevance, the last one cut short if need be.
+    if max_tokens is None:
+        max_tokens = qna_context_budget()
+    extra = []
+    if summary:
+        extra.append(f"DOCUMENT SUMMARY:\n{trim_to_tokens(summary, max_tokens // 4)}")
+    if risk_assessment:
+        extra.append(f"RISK ASSESSMENT:\n{trim_to_tokens(risk_assessment, max_tokens // 4)}")
+    remaining = max_tokens - sum(estimate_tokens(section) for section in extra)
+
+    sections = []
+    for i, _ in index.search(question, k=k):
+        heading = f"EXCERPT {i + 1}:\n"
+        room = remaining - estimate_tokens(heading)
+        # Not worth sending a few words of an excerpt
+        if room < min(128, max_tokens // 8):
+            break
+        section = heading + trim_to_tokens(index.texts[i], room)
+        sections.append(section)
+        remaining -= estimate_tokens(section)
+    return "\n\n".join(sections + extra)
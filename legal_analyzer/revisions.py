@@ -0,0 +1,146 @@
+import difflib
+import hashlib
+import re
+from collections import ChainMap
+from dataclasses import dataclass
+
+from legal_analyzer.risks import collect_risks, merge_risks, similarity, words
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# A replaced chunk of the new version is taken for an edit of the old chunk it
+# shares at least this share of words with, otherwise it counts as added
+CHANGED_SIMILARITY = 0.5
+
+
+def chunk_hash(text):
+    # Chunks that only differ in whitespace, e.g. after re-exporting a PDF,
+    # have the same hash and share their results
+    normalized = WHITESPACE_PATTERN.sub(" ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ChunkChange:
+    # status is "unchanged", "changed", "added" or "removed". new_index is None
+    # for removed chunks, old_index for added ones.
+    status: str
+    new_index: int = None
+    old_index: int = None
+
+
+def align_chunks(old_texts, new_texts):
+    # Match the chunks of two versions of a document. Runs of equal chunks are
+    # found by hash, the chunks in between are paired by word similarity so an
+    # edited clause shows up as "changed" rather than "removed" plus "added".
+    old_hashes = [chunk_hash(text) for text in old_texts]
+    new_hashes = [chunk_hash(text) for text in new_texts]
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+
+    changes = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(new_end - new_start):
+                changes.append(ChunkChange("unchanged", new_start + offset, old_start + offset))
+            continue
+
+        unmatched = {i: words(old_texts[i]) for i in range(old_start, old_end)}
+        for new_index in range(new_start, new_end):
+            new_words = words(new_texts[new_index])
+            best, best_similarity = None, CHANGED_SIMILARITY
+            for old_index, old_words in unmatched.items():
+                value = similarity(old_words, new_words)
+                if value >= best_similarity:
+                    best, best_similarity = old_index, value
+            if best is None:
+                changes.append(ChunkChange("added", new_index))
+            else:
+                del unmatched[best]
+                changes.append(ChunkChange("changed", new_index, best))
+        for old_index in unmatched:
+            changes.append(ChunkChange("removed", old_index=old_index))
+    return changes
+
+
+def count_changes(changes):
+    counts = {"unchanged": 0, "changed": 0, "added": 0, "removed": 0}
+    for change in changes:
+        counts[change.status] += 1
+    return counts
+
+
+class DocumentVersion:
+    # Chunks of one uploaded version and the results computed for them. Chunk
+    # results are keyed by chunk hash, reduced holds the intermediate summaries
+    # of the reduce step keyed by their input batch.
+    def __init__(self, texts):
+        self.texts = texts
+        self.hashes = [chunk_hash(text) for text in texts]
+        self.chunk_results = {"summaries": {}, "risks": {}}
+        self.reduced = {}
+
+
+class RevisionStore:
+    # The current and the previous version of a document under negotiation.
+    # Chunks the new version shares with the previous one reuse its results,
+    # so only new and edited chunks are sent to the LLM again.
+    def __init__(self):
+        self.previous = None
+        self.current = None
+        self.changes = None
+
+    def add_version(self, texts, compare=True):
+        # Start a new version, compared with the current one if compare is set
+        self.previous = self.current if compare else None
+        self.current = DocumentVersion(texts)
+        self.changes = None
+        if self.previous is not None:
+            self.changes = align_chunks(self.previous.texts, texts)
+        return self.changes
+
+    def missing(self, kind):
+        # Indices of the chunks of the current version that have no "summaries"
+        # or "risks" result yet, one index per distinct chunk
+        results = self.current.chunk_results[kind]
+        if self.previous is not None:
+            previous_results = self.previous.chunk_results[kind]
+            for chunk in self.current.hashes:
+                if chunk not in results and chunk in previous_results:
+                    results[chunk] = previous_results[chunk]
+        indices = {}
+        for i, chunk in enumerate(self.current.hashes):
+            if chunk not in results:
+                indices.setdefault(chunk, i)
+        return list(indices.values())
+
+    def put(self, kind, indices, values):
+        results = self.current.chunk_results[kind]
+        for i, value in zip(indices, values):
+            results[self.current.hashes[i]] = value
+
+    def known_results(self, kind):
+        # [index, result] pairs of the chunks that already have a result
+        self.missing(kind)
+        results = self.current.chunk_results[kind]
+        return [[i, results[chunk]] for i, chunk in enumerate(self.current.hashes) if chunk in results]
+
+    def results(self, kind):
+        results = self.current.chunk_results[kind]
+        return [results[chunk] for chunk in self.current.hashes]
+
+    def reduce_memo(self):
+        # Intermediate summaries of both versions, new ones go to the current one
+        if self.previous is None:
+            return self.current.reduced
+        return ChainMap(self.current.reduced, self.previous.reduced)
+
+    def previous_risks(self):
+        # Merged risk records of the previous version, None if it was not
+        # assessed completely
+        if self.previous is None:
+            return None
+        results = self.previous.chunk_results["risks"]
+        if any(chunk not in results for chunk in self.previous.hashes):
+            return None
+        records, _ = collect_risks([results[chunk] for chunk in self.previous.hashes])
+        return merge_risks(records)
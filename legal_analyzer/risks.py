@@ -0,0 +1,262 @@
+import json
+import re
+from dataclasses import dataclass, field
+
+from legal_analyzer import prompts
+
+SEVERITY_RANK = {"Low": 1, "Medium": 2, "High": 3}
+
+# Word stems of the category names models tend to use instead of ours
+CATEGORY_STEMS = {
+    "ambigu": "Ambiguity",
+    "vague": "Ambiguity",
+    "complian": "Compliance",
+    "regulat": "Compliance",
+    "contradict": "Contradiction",
+    "inconsisten": "Contradiction",
+    "missing": "Missing Terms",
+    "omission": "Missing Terms",
+    "indemn": "Indemnification",
+    "liabil": "Liability",
+    "terminat": "Termination",
+}
+
+# Risk answer recorded for a chunk the local pre-screen kept from the model,
+# followed by the reason
+SCREENED_PREFIX = "Screened out locally: "
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+CLAUSE_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)*")
+
+# Two findings in the same category are the same risk when they refer to the
+# same clause and explain it similarly, or when their explanations are nearly
+# identical
+SAME_CLAUSE_SIMILARITY = 0.4
+SAME_TEXT_SIMILARITY = 0.8
+
+
+@dataclass
+class RiskRecord:
+    clause: str
+    category: str
+    severity: str
+    explanation: str
+    chunks: list = field(default_factory=list)
+
+
+def normalize_severity(value):
+    value = str(value).strip().lower()
+    for severity in SEVERITY_RANK:
+        if value.startswith(severity.lower()):
+            return severity
+    return "Medium"
+
+
+def normalize_category(value):
+    value = str(value).strip().lower()
+    for category in prompts.RISK_CATEGORIES:
+        if category.lower() == value:
+            return category
+    for stem, category in CATEGORY_STEMS.items():
+        if stem in value:
+            return category
+    return "Other"
+
+
+def parse_risk_records(text, chunk_index=None):
+    # Parse the JSON array a chunk prompt answered with, None if the answer is
+    # not valid JSON. Code fences and text around the array are ignored.
+    start = text.find("[")
+    end = text.rfind("]")
+    if start == -1 or end < start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(items, list):
+        return None
+
+    records = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        explanation = str(item.get("explanation") or "").strip()
+        if not explanation:
+            continue
+        records.append(RiskRecord(
+            clause=str(item.get("clause") or "").strip(),
+            category=normalize_category(item.get("category", "")),
+            severity=normalize_severity(item.get("severity", "")),
+            explanation=explanation,
+            chunks=[] if chunk_index is None else [chunk_index],
+        ))
+    return records
+
+
+def words(text):
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+def similarity(a, b):
+    # Jaccard similarity of two word sets
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def clause_key(clause):
+    # "Section 4.2", "4.2 Indemnity" and "clause 4.2" all refer to the same clause
+    numbers = CLAUSE_NUMBER_PATTERN.findall(clause)
+    if numbers:
+        return tuple(numbers)
+    return frozenset(words(clause))
+
+
+def same_risk(words_a, clause_a, words_b, clause_b):
+    text_similarity = similarity(words_a, words_b)
+    return text_similarity >= SAME_TEXT_SIMILARITY or (
+        clause_a == clause_b and text_similarity >= SAME_CLAUSE_SIMILARITY
+    )
+
+
+def merge_risks(records):
+    # Deduplicate findings across chunks and sort them by severity, then by
+    # where they first appear in the document
+    merged = []
+    # category -> [(record, explanation words, clause key), ...]
+    by_category = {}
+    for record in records:
+        record_words = words(record.explanation)
+        record_clause = clause_key(record.clause)
+        for kept, kept_words, kept_clause in by_category.get(record.category, []):
+            if same_risk(kept_words, kept_clause, record_words, record_clause):
+                if SEVERITY_RANK[record.severity] > SEVERITY_RANK[kept.severity]:
+                    kept.severity = record.severity
+                if len(record.explanation) > len(kept.explanation):
+                    kept.explanation = record.explanation
+                if not kept.clause:
+                    kept.clause = record.clause
+                kept.chunks = sorted(set(kept.chunks) | set(record.chunks))
+                break
+        else:
+            kept = RiskRecord(record.clause, record.category, record.severity,
+                              record.explanation, list(record.chunks))
+            merged.append(kept)
+            by_category.setdefault(record.category, []).append((kept, record_words, record_clause))
+
+    merged.sort(key=lambda r: (-SEVERITY_RANK[r.severity], r.chunks[0] if r.chunks else 0))
+    return merged
+
+
+def risk_delta(old_records, new_records):
+    # Compare the merged registers of two versions of a document. Returns
+    # (added, removed, changed), changed holds (old, new) pairs of the same risk
+    # whose severity differs.
+    unmatched = {}
+    for record in old_records:
+        unmatched.setdefault(record.category, []).append((record, words(record.explanation), clause_key(record.clause)))
+
+    added = []
+    changed = []
+    for record in new_records:
+        record_words = words(record.explanation)
+        record_clause = clause_key(record.clause)
+        candidates = unmatched.get(record.category, [])
+        for i, (old, old_words, old_clause) in enumerate(candidates):
+            if same_risk(old_words, old_clause, record_words, record_clause):
+                del candidates[i]
+                if old.severity != record.severity:
+                    changed.append((old, record))
+                break
+        else:
+            added.append(record)
+
+    removed = [old for candidates in unmatched.values() for old, _, _ in candidates]
+    return added, removed, changed
+
+
+def format_risk_delta(added, removed, changed):
+    lines = ["## What Changed in Risk", ""]
+    if not added and not removed and not changed:
+        lines.append("The identified risks are the same as in the previous version.")
+        return "\n".join(lines)
+
+    lines.append(f"Compared with the previous version: {len(added)} new, {len(removed)} resolved, "
+                 f"{len(changed)} with a different severity.")
+    for title, records in [("New risks", added), ("Resolved risks", removed)]:
+        if records:
+            lines.append("")
+            lines.append(f"### {title}")
+            for record in records:
+                clause = f" ({record.clause})" if record.clause else ""
+                lines.append(f"- **{record.severity}** {record.category}{clause}: {record.explanation}")
+    if changed:
+        lines.append("")
+        lines.append("### Changed severity")
+        for old, new in changed:
+            clause = f" ({new.clause})" if new.clause else ""
+            lines.append(f"- {new.category}{clause}: {old.severity} -> **{new.severity}**. {new.explanation}")
+    return "\n".join(lines)
+
+
+def screened_chunks(chunk_risks):
+    # (chunk index, reason) of the chunks the pre-screen did not send to the model
+    return [
+        (i, text[len(SCREENED_PREFIX):])
+        for i, text in enumerate(chunk_risks)
+        if text.startswith(SCREENED_PREFIX)
+    ]
+
+
+def collect_risks(chunk_risks):
+    # Parse the risk answers of all chunks into (records, unparsed answers),
+    # screened chunks have neither
+    records = []
+    unparsed = []
+    for i, text in enumerate(chunk_risks):
+        if text.startswith(SCREENED_PREFIX):
+            continue
+        parsed = parse_risk_records(text, chunk_index=i)
+        if parsed is None:
+            unparsed.append(text)
+        else:
+            records.extend(parsed)
+    return records, unparsed
+
+
+def format_risk_register(records, unparsed=(), screened=()):
+    # Markdown register grouped by category, the categories with the most
+    # severe risks first. screened lists the (chunk index, reason) of chunks
+    # that were not assessed, so the report says what it did not cover.
+    if not records and not unparsed and not screened:
+        return "## Risk Register\n\nNo risks were identified in the document."
+
+    counts = {severity: 0 for severity in SEVERITY_RANK}
+    by_category = {}
+    for record in records:
+        counts[record.severity] += 1
+        by_category.setdefault(record.category, []).append(record)
+
+    lines = ["## Risk Register", ""]
+    lines.append(f"{len(records)} risks identified: "
+                 f"{counts['High']} High, {counts['Medium']} Medium, {counts['Low']} Low.")
+    for category, category_records in by_category.items():
+        lines.append("")
+        lines.append(f"### {category}")
+        for record in category_records:
+            clause = f" ({record.clause})" if record.clause else ""
+            lines.append(f"- **{record.severity}**{clause}: {record.explanation}")
+
+    if unparsed:
+        lines.append("")
+        lines.append("### Further findings")
+        lines.extend(text.strip() for text in unparsed)
+
+    if screened:
+        lines.append("")
+        lines.append("### Not assessed")
+        lines.append("These parts of the document had no risk-bearing content and were not sent to the model:")
+        for i, reason in screened:
+            lines.append(f"- Part {i + 1}: {reason}")
+    return "\n".join(lines)
@@ -0,0 +1,217 @@
+import threading
+import time
+from contextlib import nullcontext
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from legal_analyzer import config, prompts
+from legal_analyzer.backends import create_llm
+from legal_analyzer.cache import get_shared_cache, make_key
+from legal_analyzer.mapper import call_with_backoff, estimate_request_tokens, map_ordered
+from legal_analyzer.ratelimit import estimate_tokens, get_shared_limiter
+from legal_analyzer.tracing import span, start_span, use_span
+
+# Trace span name of the calls of every prompt template, e.g. "llm.chunk_summary"
+SPAN_NAMES = {
+    template: "llm." + name[:-len("_PROMPT")].lower()
+    for name, template in vars(prompts).items()
+    if name.endswith("_PROMPT")
+}
+
+
+class LLMRunner:
+    # Runs prompt templates against the LLM. Every call is looked up in the
+    # cache first, and only misses go through the rate limiter to the provider.
+    # max_in_flight optionally bounds the provider calls running at once across
+    # every thread that shares the runner.
+    def __init__(self, llm, model_name, limiter=None, cache=None, max_in_flight=None):
+        self.llm = llm
+        self.model_name = model_name
+        self.limiter = limiter
+        self.cache = cache
+        # The chains of every pipeline prompt are built up front, the chain of
+        # any other template on first use
+        self.chains = {template: self.build_chain(template) for template in SPAN_NAMES}
+        self.chains_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else nullcontext()
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def record(self, inputs, result, usage, call_span):
+        # Token usage of a provider call as reported in the response metadata,
+        # estimated when the provider did not report it
+        if usage:
+            tokens_in = usage.get("input_tokens", 0)
+            tokens_out = usage.get("output_tokens", 0)
+        else:
+            tokens_in = estimate_request_tokens(inputs) - config.COMPLETION_TOKENS
+            tokens_out = estimate_tokens(result)
+        call_span.set("tokens_in", tokens_in)
+        call_span.set("tokens_out", tokens_out)
+        call_span.set("tokens_estimated", not usage)
+        with self.stats_lock:
+            self.calls += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+
+    def usage(self):
+        with self.stats_lock:
+            return {
+                "calls": self.calls,
+                "cache_hits": self.cache_hits,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+            }
+
+    def lookup(self, template, inputs):
+        # (cache key, cached answer), the key is None when caching is off
+        if self.cache is None:
+            return None, None
+        key = make_key(self.model_name, template, inputs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self.stats_lock:
+                self.cache_hits += 1
+        return key, cached
+
+    def build_chain(self, template):
+        # No output parser, the message carries the usage metadata
+        return ChatPromptTemplate.from_template(template) | self.llm
+
+    def chain(self, template):
+        chain = self.chains.get(template)
+        if chain is None:
+            with self.chains_lock:
+                chain = self.chains.setdefault(template, self.build_chain(template))
+        return chain
+
+    def invoke(self, template, inputs, use_cache=True):
+        with span(SPAN_NAMES.get(template, "llm.call")) as call_span:
+            key = None
+            if use_cache:
+                key, cached = self.lookup(template, inputs)
+                if cached is not None:
+                    call_span.set("cache_hits", 1)
+                    return cached
+
+            # Waiting for an in-flight slot counts as queue time
+            wait_start = time.perf_counter()
+            with self.slots:
+                call_span.add("queue_wait", time.perf_counter() - wait_start)
+                message = call_with_backoff(self.chain(template).invoke, inputs, self.limiter)
+            result = message.content
+            self.record(inputs, result, message.usage_metadata, call_span)
+
+            if key is not None:
+                self.cache.put(key, self.model_name, result)
+            return result
+
+    def stream(self, template, inputs, use_cache=True):
+        # Like invoke(), but yields the answer piece by piece as the model
+        # produces it. A 429 can only come with the first piece, so retries
+        # happen before anything has been yielded. The trace span is ended by
+        # hand, a span() block can't stay open across the yields.
+        call_span = start_span(SPAN_NAMES.get(template, "llm.call"), streamed=True)
+        try:
+            key = None
+            if use_cache:
+                key, cached = self.lookup(template, inputs)
+                if cached is not None:
+                    call_span.set("cache_hits", 1)
+                    yield cached
+                    return
+
+            chain = self.chain(template)
+
+            def start_stream(inputs):
+                pieces = chain.stream(inputs)
+                return pieces, next(pieces, None)
+
+            wait_start = time.perf_counter()
+            with use_span(call_span), self.slots:
+                call_span.add("queue_wait", time.perf_counter() - wait_start)
+                pieces, first_piece = call_with_backoff(start_stream, inputs, self.limiter)
+            call_span.set("first_token_seconds", round(call_span.seconds, 3))
+
+            answer = []
+            usage = None
+            if first_piece is not None:
+                pieces = chain_pieces(first_piece, pieces)
+            for piece in pieces:
+                # The usage metadata comes with the last piece, if at all
+                if piece.usage_metadata:
+                    usage = piece.usage_metadata
+                if piece.content:
+                    answer.append(piece.content)
+                    yield piece.content
+            self.record(inputs, "".join(answer), usage, call_span)
+
+            if key is not None:
+                self.cache.put(key, self.model_name, "".join(answer))
+        except GeneratorExit:
+            # The reader stopped early, that's not an error
+            call_span.set("abandoned", True)
+            raise
+        except BaseException as e:
+            call_span.end(error=e)
+            raise
+        finally:
+            call_span.end()
+
+    def map(self, template, inputs_list, on_progress=None, use_cache=True, on_result=None):
+        # invoke() over every inputs dict concurrently, results in input order.
+        # inputs_list may be a stream, see map_ordered.
+        return map_ordered(
+            lambda inputs: self.invoke(template, inputs, use_cache=use_cache),
+            inputs_list,
+            on_progress=on_progress,
+            on_result=on_result,
+        )
+
+
+def create_runner(max_in_flight=None, llm=None):
+    # Runner for the configured backend, sharing the process-wide rate limiter
+    # and cache
+    if llm is None:
+        llm = create_llm()
+    return LLMRunner(
+        llm,
+        llm.model_name,
+        limiter=get_shared_limiter(),
+        cache=get_shared_cache(),
+        max_in_flight=max_in_flight,
+    )
+
+
+_shared_runner = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_runner():
+    # One runner per process: every session and job shares the LLM client,
+    # its HTTP connections and the built chains
+    global _shared_runner
+    with _shared_lock:
+        if _shared_runner is None:
+            _shared_runner = create_runner()
+        return _shared_runner
+
+
+def chain_pieces(first_piece, pieces):
+    yield first_piece
+    yield from pieces
+
+
+def track_first_token(pieces, on_first_token):
+    # Pass a stream through and report the seconds until its first piece,
+    # counted from when the stream is first read
+    start = time.perf_counter()
+    first = True
+    for piece in pieces:
+        if first:
+            on_first_token(time.perf_counter() - start)
+            first = False
+        yield piece
@@ -0,0 +1,320 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from legal_analyzer import config, prompts
+from legal_analyzer.answers import answer_context_key, get_answer_cache, normalize_question
+from legal_analyzer.chunking import chunk_stats, chunk_token_budget
+from legal_analyzer.docstore import document_key, get_document_store
+from legal_analyzer.ingest import FORMATS_BY_TYPE, get_format, iter_document_chunks, iter_pages
+from legal_analyzer.pipeline import assess_chunks, reduce_risks, reduce_summaries, summarize_chunks
+from legal_analyzer.retrieval import build_context, get_index
+from legal_analyzer.runner import get_shared_runner
+from legal_analyzer.tracing import trace
+
+# Finished summaries and risk assessments kept in memory, they are also given
+# as context to questions about their document, as in the app
+MAX_RESULTS = 256
+
+# POST /documents/<id>/<operation>
+OPERATION_PATH = re.compile(r"^/documents/([0-9a-f]{64})/(summary|risks|questions)$")
+DOCUMENT_PATH = re.compile(r"^/documents/([0-9a-f]{64})$")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Coalescer:
+    # Runs computations in a pool of max_workers threads, with at most
+    # max_queue more waiting for a thread. A request for a computation that is
+    # already queued or running shares its result instead of starting it again,
+    # a request for a new one while the queue is full raises QueueFull.
+    def __init__(self, max_workers, max_queue):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+        self.capacity = max_workers + max_queue
+        self.lock = threading.Lock()
+        # key -> Future of the computations queued or running
+        self.in_flight = {}
+        self.started = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def submit(self, key, func, *args):
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if len(self.in_flight) >= self.capacity:
+                self.rejected += 1
+                raise QueueFull()
+            future = self.pool.submit(func, *args)
+            self.in_flight[key] = future
+            self.started += 1
+        future.add_done_callback(lambda done: self.finish(key, done))
+        return future
+
+    def finish(self, key, future):
+        with self.lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": len(self.in_flight),
+                "capacity": self.capacity,
+                "started": self.started,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+
+class AnalysisService:
+    # The operations of the HTTP API on top of the analysis pipeline. Documents
+    # live in the process-wide document store, so the app and the API share
+    # them, and every operation runs through the coalescer.
+    def __init__(self, runner=None, max_workers=None, max_queue=None):
+        self.runner = runner or get_shared_runner()
+        self.coalescer = Coalescer(max_workers or config.API_WORKERS, max_queue or config.API_MAX_QUEUE)
+        self.documents = get_document_store()
+        self.answers = get_answer_cache()
+        self.results_lock = threading.Lock()
+        # (document key, "summary" or "risks") -> result
+        self.results = OrderedDict()
+
+    def upload(self, data, name, file_type):
+        # {"document_id", "chunks"} of the uploaded file content, read and
+        # split once however often and by whomever it is uploaded
+        key = document_key(data, file_type, chunk_token_budget())
+        document = self.documents.get(key)
+        if document is None:
+            document = self.coalescer.submit(("upload", key), self.read, key, data, name, file_type).result()
+        return {"document_id": key, "chunks": len(document)}
+
+    def read(self, key, data, name, file_type):
+        with trace("api upload", file_type=file_type) as run:
+            pages = []
+            chunks = list(iter_document_chunks(iter_pages(data, name, file_type), on_page=pages.append))
+            document = self.documents.put(key, chunks, chunk_stats(pages, chunks))
+            get_index(document, key=document.key)
+            run.root.set("pages", len(pages))
+            run.root.set("chunks", len(document))
+        return document
+
+    def document(self, key):
+        # The stored document, None when it was never uploaded or has been
+        # evicted from the store since
+        return self.documents.get(key)
+
+    def result(self, document, operation):
+        # The summary or risk assessment of a document, computed once while
+        # it is being requested and kept for MAX_RESULTS results
+        with self.results_lock:
+            result = self.results.get((document.key, operation))
+            if result is not None:
+                self.results.move_to_end((document.key, operation))
+                return result
+        compute = self.summarize if operation == "summary" else self.assess
+        return self.coalescer.submit((operation, document.key), compute, document).result()
+
+    def remember(self, document, operation, result):
+        with self.results_lock:
+            self.results[(document.key, operation)] = result
+            while len(self.results) > MAX_RESULTS:
+                self.results.popitem(last=False)
+
+    def known_result(self, document, operation):
+        with self.results_lock:
+            return self.results.get((document.key, operation), "")
+
+    def summarize(self, document):
+        with trace("api summary", chunks=len(document)):
+            summary = reduce_summaries(self.runner, summarize_chunks(self.runner, list(document)))
+        self.remember(document, "summary", summary)
+        return summary
+
+    def assess(self, document):
+        with trace("api risk assessment", chunks=len(document)):
+            risk_assessment = reduce_risks(self.runner, assess_chunks(self.runner, list(document)))
+        self.remember(document, "risks", risk_assessment)
+        return risk_assessment
+
+    def ask(self, document, question):
+        # Answer a question about a document, with its summary and risk
+        # assessment as context once they have been computed
+        summary = self.known_result(document, "summary")
+        risk_assessment = self.known_result(document, "risks")
+        context_key = answer_context_key(self.runner.model_name, document.key, summary, risk_assessment)
+        if self.answers is not None:
+            answer, _ = self.answers.get(context_key, question)
+            if answer is not None:
+                return answer
+        key = ("question", context_key, normalize_question(question))
+        future = self.coalescer.submit(key, self.answer, document, question, summary, risk_assessment, context_key)
+        return future.result()
+
+    def answer(self, document, question, summary, risk_assessment, context_key):
+        with trace("api qna"):
+            context = build_context(
+                get_index(document, key=document.key),
+                question,
+                summary=summary,
+                risk_assessment=risk_assessment,
+                k=config.QNA_TOP_K,
+            )
+            answer = self.runner.invoke(prompts.CHAT_PROMPT, {"context": context, "question": question}, use_cache=False)
+        if self.answers is not None:
+            self.answers.put(context_key, question, answer)
+        return answer
+
+    def stats(self):
+        stats = self.coalescer.stats()
+        stats["documents"] = self.documents.stats()["documents"]
+        stats["llm"] = self.runner.usage()
+        if self.answers is not None:
+            stats["answers"] = self.answers.stats()
+        return stats
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    # JSON API of an AnalysisService:
+    #   GET  /health                          queue and cache statistics
+    #   POST /documents?name=contract.pdf     upload, the body is the file content
+    #   GET  /documents/<id>                  whether a document is stored
+    #   POST /documents/<id>/summary          {"summary": ...}
+    #   POST /documents/<id>/risks            {"risk_assessment": ...}
+    #   POST /documents/<id>/questions        {"question": ...} -> {"answer": ...}
+    # A full queue is answered with 503 and a Retry-After header.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, without this every response
+    # waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+    service = None
+    body_read = False
+
+    def do_GET(self):
+        self.handle_api(self.get)
+
+    def do_POST(self):
+        self.handle_api(self.post)
+
+    def handle_api(self, method):
+        headers = {}
+        self.body_read = False
+        try:
+            status, body = method(urlparse(self.path))
+        except APIError as e:
+            status, body = e.status, {"error": str(e)}
+        except QueueFull:
+            status, body = 503, {"error": "Too many requests in progress, retry later"}
+            headers["Retry-After"] = "1"
+        except Exception as e:
+            print("Error in API request", self.path, e)
+            status, body = 500, {"error": str(e)}
+        if status < 400 and not self.body_read:
+            # A body the operation doesn't use, e.g. sent with a summary
+            # request, would otherwise be read as the next request
+            try:
+                self.read_body()
+            except APIError as e:
+                status, body = e.status, {"error": str(e)}
+        if status >= 400:
+            # The request body may not have been read, it can't be told apart
+            # from the next request on the connection
+            headers["Connection"] = "close"
+        self.send_json(status, body, headers)
+
+    def get(self, url):
+        if url.path == "/health":
+            return 200, {"status": "ok", **self.service.stats()}
+        match = DOCUMENT_PATH.match(url.path)
+        if match:
+            document = self.stored_document(match.group(1))
+            return 200, {"document_id": document.key, "chunks": len(document)}
+        raise APIError(404, f"Not found: {url.path}")
+
+    def post(self, url):
+        if url.path == "/documents":
+            name = parse_qs(url.query).get("name", ["document"])[0]
+            file_format = get_format(name, self.headers.get("Content-Type", ""))
+            if file_format is None:
+                raise APIError(415, "Unsupported file type, send a PDF, text or CSV file")
+            # The type the app reports for the format, so a document uploaded
+            # with charset parameters or as application/octet-stream is shared
+            file_type = next(type_ for type_, format_ in FORMATS_BY_TYPE.items() if format_ == file_format)
+            return 201, self.service.upload(self.read_body(), name, file_type)
+
+        match = OPERATION_PATH.match(url.path)
+        if not match:
+            raise APIError(404, f"Not found: {url.path}")
+        document = self.stored_document(match.group(1))
+        operation = match.group(2)
+        if operation == "summary":
+            return 200, {"summary": self.service.result(document, "summary")}
+        if operation == "risks":
+            return 200, {"risk_assessment": self.service.result(document, "risks")}
+        try:
+            question = json.loads(self.read_body() or b"{}").get("question", "").strip()
+        except (ValueError, AttributeError):
+            raise APIError(400, "Send a JSON object with a question")
+        if not question:
+            raise APIError(400, "Send a JSON object with a question")
+        return 200, {"answer": self.service.ask(document, question)}
+
+    def stored_document(self, key):
+        document = self.service.document(key)
+        if document is None:
+            raise APIError(404, "Unknown document, upload it first")
+        return document
+
+    def read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise APIError(400, "Invalid Content-Length")
+        if length > config.API_MAX_UPLOAD_BYTES:
+            raise APIError(413, f"Request body over {config.API_MAX_UPLOAD_BYTES} bytes")
+        self.body_read = True
+        return self.rfile.read(length)
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host="127.0.0.1", port=8000, service=None):
+    # HTTP server of the API, call serve_forever() on it to run it
+    service = service or AnalysisService()
+    handler = type("Handler", (APIHandler,), {"service": service})
+    # Listen backlog, the default of 5 resets connections of clients beyond it
+    # while the handler threads are starting. It is read when the server
+    # binds, so it is set on a subclass.
+    server_class = type("Server", (ThreadingHTTPServer,), {
+        "request_queue_size": max(128, service.coalescer.capacity),
+    })
+    server = server_class((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,188 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from legal_analyzer import config
+
+# Trace of the analysis run in progress and the innermost open span. Worker
+# threads see them because map_ordered runs every task in a copy of the
+# submitting thread's context.
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_export_lock = threading.Lock()
+
+# Numeric span attributes that the performance summary adds up per stage
+SUMMED_ATTRIBUTES = ["tokens_in", "tokens_out", "retries", "queue_wait", "cache_hits", "screened", "tokens_screened",
+                     "requests_saved", "prompt_tokens_saved"]
+
+
+class Span:
+    # One timed stage of an analysis run, exported in the shape of an
+    # OpenTelemetry span
+    def __init__(self, trace, name, parent, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes)
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, key, value):
+        with self.trace.lock:
+            self.attributes[key] = value
+
+    def add(self, key, amount):
+        with self.trace.lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        if error is not None:
+            self.status = "ERROR"
+            self.set("error", str(error))
+        self.end_ns = time.time_ns()
+
+    @property
+    def seconds(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.seconds * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class NullSpan:
+    # Stands in for a span when no trace is active
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Trace:
+    def __init__(self, name, attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.spans = []
+        self.root = self.start_span(name, None, attributes)
+
+    def start_span(self, name, parent, attributes):
+        span = Span(self, name, parent, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def summary(self):
+        # One row per stage name in order of first appearance: number of spans,
+        # total seconds and the sums of the numeric attributes
+        rows = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault(span.name, {"stage": span.name, "count": 0, "seconds": 0.0})
+            row["count"] += 1
+            row["seconds"] += span.seconds
+            for key in SUMMED_ATTRIBUTES:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)):
+                    row[key] = row.get(key, 0) + value
+        for row in rows.values():
+            row["seconds"] = round(row["seconds"], 3)
+            if "queue_wait" in row:
+                row["queue_wait"] = round(row["queue_wait"], 3)
+        return list(rows.values())
+
+
+def export(trace):
+    # Append the spans of a finished run to the JSON Lines trace log
+    print(f"Trace {trace.root.name}: {trace.root.seconds:.2f}s, {len(trace.spans)} spans")
+    if not config.TRACE_LOG_PATH:
+        return
+    with trace.lock:
+        lines = [json.dumps(span.to_dict(), ensure_ascii=False) for span in trace.spans]
+    with _export_lock:
+        with open(config.TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def trace(name, **attributes):
+    # Record the spans of one analysis run, exported when the run ends
+    run = Trace(name, attributes)
+    trace_token = _current_trace.set(run)
+    span_token = _current_span.set(run.root)
+    try:
+        yield run
+    except BaseException as e:
+        run.root.end(error=e)
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        run.root.end()
+        export(run)
+
+
+def start_span(name, **attributes):
+    # Span under the current span, ended by the caller. Use this instead of
+    # span() where the work spans yields of a generator.
+    run = _current_trace.get()
+    if run is None:
+        return NULL_SPAN
+    return run.start_span(name, _current_span.get(), attributes)
+
+
+@contextmanager
+def use_span(span):
+    # Make span the parent of the spans and attributes recorded in the block
+    if span is NULL_SPAN:
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    current = start_span(name, **attributes)
+    try:
+        with use_span(current):
+            yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        current.end()
+
+
+def add_to_current_span(key, amount):
+    current = _current_span.get()
+    if current is not None:
+        current.add(key, amount)
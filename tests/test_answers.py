@@ -0,0 +1,82 @@
+from legal_analyzer import answers
+from legal_analyzer.answers import AnswerCache, question_terms, similarity
+
+CONTEXT = "context"
+
+
+def test_paraphrase_gives_same_terms():
+    assert question_terms("What's the notice period for termination?") == question_terms(
+        "what is the termination notice period"
+    )
+
+
+def test_question_words_are_kept():
+    assert "who" in question_terms("Who can terminate the agreement?")
+    assert "when" in question_terms("When can the agreement terminate?")
+
+
+def test_different_question_words_do_not_match():
+    assert similarity(
+        question_terms("Who can terminate the agreement?"),
+        question_terms("When can the agreement terminate?"),
+    ) == 0.0
+
+
+def test_negated_question_does_not_match():
+    assert similarity(
+        question_terms("Can the supplier assign the agreement?"),
+        question_terms("Can't the supplier assign the agreement?"),
+    ) == 0.0
+
+
+def test_exact_hit():
+    cache = AnswerCache(max_entries=8, ttl=0, min_similarity=0.8)
+    cache.put(CONTEXT, "What is the termination notice period?", "30 days")
+    assert cache.get(CONTEXT, "what is the  termination notice period") == ("30 days", "exact")
+
+
+def test_similar_hit():
+    cache = AnswerCache(max_entries=8, ttl=0, min_similarity=0.8)
+    cache.put(CONTEXT, "What is the termination notice period?", "30 days")
+    assert cache.get(CONTEXT, "What's the notice period for termination?") == ("30 days", "similar")
+
+
+def test_similar_miss_on_question_word():
+    cache = AnswerCache(max_entries=8, ttl=0, min_similarity=0.8)
+    cache.put(CONTEXT, "Who can terminate the agreement?", "Either party")
+    assert cache.get(CONTEXT, "When can the agreement terminate?") == (None, None)
+    assert cache.stats()["misses"] == 1
+
+
+def test_similar_miss_without_min_similarity():
+    cache = AnswerCache(max_entries=8, ttl=0, min_similarity=0)
+    cache.put(CONTEXT, "What is the termination notice period?", "30 days")
+    assert cache.get(CONTEXT, "What's the notice period for termination?") == (None, None)
+
+
+def test_other_context_misses():
+    cache = AnswerCache(max_entries=8, ttl=0, min_similarity=0.8)
+    cache.put(CONTEXT, "What is the termination notice period?", "30 days")
+    assert cache.get("other", "What is the termination notice period?") == (None, None)
+
+
+def test_expired_answer_misses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answers.time, "time", lambda: now[0])
+    cache = AnswerCache(max_entries=8, ttl=60, min_similarity=0.8)
+    cache.put(CONTEXT, "What is the termination notice period?", "30 days")
+    now[0] += 61
+    assert cache.get(CONTEXT, "What is the termination notice period?") == (None, None)
+    assert cache.get(CONTEXT, "What's the notice period for termination?") == (None, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = AnswerCache(max_entries=2, ttl=0, min_similarity=0.8)
+    cache.put(CONTEXT, "Which law governs the agreement?", "English law")
+    cache.put(CONTEXT, "When are invoices payable?", "Within 30 days")
+    cache.get(CONTEXT, "Which law governs the agreement?")
+    cache.put(CONTEXT, "Who has to indemnify whom?", "The supplier")
+    assert cache.get(CONTEXT, "When are invoices payable?") == (None, None)
+    assert cache.get(CONTEXT, "Which law governs the agreement?") == ("English law", "exact")
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,21 @@
+import random
+
+from legal_analyzer.chunking import split_to_budget
+from legal_analyzer.ratelimit import estimate_tokens
+
+
+def test_split_to_budget_keeps_every_piece_in_budget():
+    rng = random.Random(0)
+    alphabet = "abcdefghij .,;\n"
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 400)))
+        max_tokens = rng.randint(1, 40)
+        pieces = split_to_budget(text, max_tokens)
+        assert "".join(pieces) == text
+        assert all(estimate_tokens(piece) <= max_tokens for piece in pieces)
+
+
+def test_split_to_budget_cuts_text_without_boundaries():
+    pieces = split_to_budget("x" * 100, 8)
+    assert all(estimate_tokens(piece) <= 8 for piece in pieces)
+    assert "".join(pieces) == "x" * 100
@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+
+from legal_analyzer.docstore import DocumentStore
+from legal_analyzer.retrieval import get_index
+
+
+def chunks(seed, count=20):
+    return [
+        Document(page_content=f"Clause {seed}.{i}. The Supplier shall deliver goods number {i} on request.",
+                 metadata={"page": i})
+        for i in range(count)
+    ]
+
+
+def test_index_counts_in_document_size():
+    store = DocumentStore()
+    document = store.put("key", chunks(0))
+    size = document.nbytes()
+    index = get_index(document, key=document.key)
+    assert get_index(document, key=document.key) is index
+    assert document.nbytes() > size
+    store.get("key")
+    assert store.stats()["recent_bytes"] == document.nbytes()
+
+
+def test_evicted_documents_are_freed_with_their_index():
+    store = DocumentStore(max_bytes=1)
+    for seed in range(5):
+        document = store.put(f"key{seed}", chunks(seed))
+        index = get_index(document, key=document.key)
+        assert index.search("deliver goods")
+    del document, index
+    assert len(store.live) == 1
+    assert store.stats()["documents"] == 1
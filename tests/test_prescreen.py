@@ -0,0 +1,46 @@
+import pytest
+
+from legal_analyzer.prescreen import is_boilerplate, screen_chunk
+
+
+@pytest.mark.parametrize("text", [
+    "7. Delivery. The Supplier shall deliver the Goods within 5 days after the Buyer gives notice. "
+    "Late delivery gives the Buyer no remedy.",
+    "The Supplier will provide the Services described in Schedule 1.",
+    "The Customer may reject any Deliverable that does not meet the Specification.",
+    "All Deliverables are owned by the Customer upon delivery.",
+    "The Employee should not work for a competitor for 5 years worldwide.",
+    "The Contractor is required to keep records of all work performed.",
+    "1. Definitions\n\"Services\" means the services set out in the Order.\n"
+    "\"Affiliate\" shall have the meaning given in Clause 12.",
+])
+def test_substantive_clauses_are_sent(text):
+    assert not screen_chunk(text).skip
+
+
+@pytest.mark.parametrize("text", [
+    "IN WITNESS WHEREOF the parties have caused this Agreement to be executed.\n"
+    "By: ____________\nName: Jane Doe\nTitle: Director",
+    "Table of Contents\n1. Services ........ 2\n2. Fees ........ 5\nPage 1 of 20",
+])
+def test_boilerplate_is_skipped(text):
+    assert screen_chunk(text).skip
+
+
+@pytest.mark.parametrize("line", [
+    "221B Baker Street, London NW1 6XE",
+    "1 Main Street, Suite 200, Springfield, IL 62701",
+    "100 Fifth Ave., 3rd Floor",
+    "Attention: General Counsel",
+])
+def test_address_lines_are_boilerplate(line):
+    assert is_boilerplate(line)
+
+
+@pytest.mark.parametrize("line", [
+    "12 Tenant shall keep the premises on the 3rd floor in good repair at its own cost.",
+    "4 The tenant is on the second floor",
+    "3 Delivery to the Buyer on Main Road within ten days",
+])
+def test_numbered_clauses_are_not_boilerplate(line):
+    assert not is_boilerplate(line)
@@ -0,0 +1,66 @@
+from legal_analyzer.reduce import SEPARATOR, combined_tokens, plan_nodes, tree_reduce
+
+
+def words(count, word="clause"):
+    # About count * 2 tokens of text
+    return " ".join([word] * count)
+
+
+def test_plan_nodes_combines_at_small_fan_in():
+    texts = [words(10, f"text{i}") for i in range(20)]
+    for size in (2, 3):
+        nodes = plan_nodes(texts, 10**6, size)
+        assert [len(node) for node in nodes[:-1]] == [size] * (len(nodes) - 1)
+        assert sum(len(node) for node in nodes) == len(texts)
+
+
+def test_plan_nodes_keeps_nodes_under_budget():
+    texts = [words(300, f"text{i}") for i in range(30)]
+    for node in plan_nodes(texts, 4000, 8):
+        assert combined_tokens(node) <= 4000
+
+
+def test_plan_nodes_averages_about_size():
+    texts = [f"text {i}" for i in range(4000)]
+    nodes = plan_nodes(texts, 10**6, 12)
+    assert 10.5 <= len(texts) / len(nodes) <= 12.5
+
+
+def test_tree_reduce_with_long_outputs():
+    # Reduce outputs of up to 60% of the budget: the outputs of a level don't
+    # fit in pairs unless they are split again
+    max_tokens = 4000
+    texts = [words(500, f"input{i}") for i in range(40)]
+    calls = []
+
+    def reduce_node(node):
+        calls.append(len(node))
+        return words(min(1200, combined_tokens(node) * 3 // 10), "summary")
+
+    result = tree_reduce(texts, reduce_node, max_tokens)
+    assert combined_tokens(result) <= max_tokens
+    assert len(calls) < len(texts)
+
+
+def test_tree_reduce_stops_when_outputs_do_not_shorten():
+    calls = []
+
+    def reduce_node(node):
+        calls.append(node)
+        return words(1200, "summary")
+
+    result = tree_reduce([words(500, f"input{i}") for i in range(40)], reduce_node, 4000)
+    assert result
+    assert len(calls) < 100
+
+
+def test_tree_reduce_splits_a_single_long_text():
+    result = tree_reduce([words(5000)], lambda node: words(100, "summary"), 4000)
+    assert combined_tokens(result) <= 4000
+
+
+def test_tree_reduce_leaves_texts_that_fit():
+    texts = [words(10), words(20)]
+    calls = []
+    assert tree_reduce(texts, lambda node: calls.append(node) or SEPARATOR.join(node), 4000) == texts
+    assert calls == []
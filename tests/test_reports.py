@@ -0,0 +1,22 @@
+import pytest
+
+from legal_analyzer import config
+from legal_analyzer.reports import render_pdf
+
+
+def test_unicode_report_embeds_the_shipped_font(monkeypatch):
+    monkeypatch.setattr(config, "REPORT_FONT_PATH", "")
+    pdf = render_pdf([("Risk “Assessment”", "Договор — 合同 – “quoted”")])
+    assert pdf.startswith(b"%PDF")
+    assert b"DejaVuSans" in pdf
+
+
+def test_latin1_report_uses_the_core_font():
+    pdf = render_pdf([("Summary", "Plain Latin-1 text, café.")])
+    assert b"DejaVuSans" not in pdf
+
+
+def test_missing_font_fails(monkeypatch):
+    monkeypatch.setattr(config, "REPORT_FONT_PATH", "/nonexistent/font.ttf")
+    with pytest.raises(FileNotFoundError):
+        render_pdf([("Summary", "“quoted”")])
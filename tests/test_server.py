@@ -0,0 +1,68 @@
+import http.client
+import threading
+
+import pytest
+
+from legal_analyzer.backends import FakeChatModel
+from legal_analyzer.runner import LLMRunner
+from legal_analyzer.server import AnalysisService, create_server
+
+CONTRACT = b"1. Term. This Agreement shall terminate on 31 December 2030.\n\n2. Fees. The Customer shall pay all invoices within 30 days."
+
+
+@pytest.fixture
+def server():
+    llm = FakeChatModel(latency=0)
+    server = create_server("127.0.0.1", 0, AnalysisService(LLMRunner(llm, llm.model_name), max_workers=2, max_queue=3))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def connect(server):
+    return http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+
+
+def upload(connection, content_type="text/plain"):
+    connection.request("POST", "/documents?name=contract.txt", body=CONTRACT, headers={"Content-Type": content_type})
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def test_backlog_follows_the_service_capacity():
+    llm = FakeChatModel(latency=0)
+    service = AnalysisService(LLMRunner(llm, llm.model_name), max_workers=100, max_queue=200)
+    server = create_server("127.0.0.1", 0, service)
+    server.server_close()
+    assert server.request_queue_size == 300
+
+
+def test_upload_types(server):
+    connection = connect(server)
+    assert upload(connection, "text/plain; charset=utf-8")[0] == 201
+    assert upload(connection, "application/octet-stream")[0] == 201
+
+
+def test_unused_body_is_drained(server):
+    connection = connect(server)
+    status, body = upload(connection)
+    document_id = body.decode().split('"document_id": "')[1][:64]
+    connection.request("POST", f"/documents/{document_id}/summary", body=b'{"ignored": true}')
+    response = connection.getresponse()
+    assert response.status == 200
+    response.read()
+    # The same connection still reads the next request correctly
+    connection.request("GET", "/health")
+    response = connection.getresponse()
+    assert response.status == 200
+    response.read()
+
+
+def test_negative_content_length_is_rejected(server):
+    connection = connect(server)
+    connection.putrequest("POST", "/documents?name=contract.txt")
+    connection.putheader("Content-Type", "text/plain")
+    connection.putheader("Content-Length", "-1")
+    connection.endheaders()
+    assert connection.getresponse().status == 400